@@ -4,18 +4,28 @@ Provides comprehensive insights and metrics.
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, desc, case, select
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+import asyncio
 import json
+import os
 
-from ..models.database import get_database, User, Session as TherapySession, MoodEntry, Interaction
+from ..models.database import get_database, SessionLocal, User, TherapySession, MoodEntry, Interaction, DailyUserStats
+from ..core.cache import TTLCache
 from ..core.logging import get_logger, LogContext
 from ..core.exceptions import DatabaseError, ValidationError
+from ..services.database_service import DAILY_STATS_BACKFILL_DAYS
 
 router = APIRouter(prefix="/api/v1/analytics", tags=["analytics"])
 logger = get_logger('voice-cbt.analytics')
 
+# Dashboards poll the overview; identical requests within the TTL share one set of scans
+OVERVIEW_CACHE_MAX_SIZE = 16
+OVERVIEW_CACHE_TTL_SECONDS = int(os.getenv("OVERVIEW_CACHE_TTL_SECONDS", "30"))
+_overview_cache = TTLCache(max_size=OVERVIEW_CACHE_MAX_SIZE, ttl_seconds=OVERVIEW_CACHE_TTL_SECONDS)
+
 @router.get("/overview")
 async def get_analytics_overview(
     days: int = Query(30, description="Number of days to analyze"),
@@ -24,14 +34,20 @@ async def get_analytics_overview(
     """Get comprehensive analytics overview."""
     
     with LogContext(logger, endpoint="analytics_overview", days=days):
+        cached = _overview_cache.get(days)
+        if cached is not None:
+            return cached
+        
         try:
             # Calculate date range
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # Get basic metrics
-            total_users = db.query(User).count()
-            active_users = db.query(User).filter(User.is_active == True).count()
+            # Get basic metrics; both user counts come back in one row
+            total_users, active_users = db.query(
+                func.count(User.id),
+                func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0)
+            ).one()
             
             # Session metrics
             total_sessions = db.query(TherapySession).filter(
@@ -43,27 +59,21 @@ async def get_analytics_overview(
                 TherapySession.status == "completed"
             ).count()
             
-            # Average session duration
-            sessions_with_duration = db.query(TherapySession).filter(
-                TherapySession.started_at >= start_date,
-                TherapySession.duration_minutes.isnot(None)
-            ).all()
-            
-            avg_duration = sum(s.duration_minutes for s in sessions_with_duration) / len(sessions_with_duration) if sessions_with_duration else 0
+            # Average session duration (AVG ignores sessions without a duration)
+            avg_duration = float(db.query(func.avg(TherapySession.duration_minutes)).filter(
+                TherapySession.started_at >= start_date
+            ).scalar() or 0)
             
-            # Mood analytics
-            mood_entries = db.query(MoodEntry).filter(
+            # Emotion distribution, counted by the database, most common first
+            emotion_counts = dict(db.query(
+                MoodEntry.emotion,
+                func.count(MoodEntry.id)
+            ).filter(
                 MoodEntry.timestamp >= start_date
-            ).all()
-            
-            # Emotion distribution
-            emotion_counts = {}
-            for entry in mood_entries:
-                emotion = entry.emotion
-                emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+            ).group_by(MoodEntry.emotion).order_by(desc(func.count(MoodEntry.id))).all())
             
             # Calculate emotion percentages
-            total_mood_entries = len(mood_entries)
+            total_mood_entries = sum(emotion_counts.values())
             emotion_percentages = {
                 emotion: (count / total_mood_entries * 100) if total_mood_entries > 0 else 0
                 for emotion, count in emotion_counts.items()
@@ -79,7 +89,7 @@ async def get_analytics_overview(
                 MoodEntry.timestamp >= recent_start
             ).count()
             
-            return {
+            overview = {
                 "period": {
                     "start_date": start_date.isoformat(),
                     "end_date": end_date.isoformat(),
@@ -99,13 +109,15 @@ async def get_analytics_overview(
                 "emotions": {
                     "total_entries": total_mood_entries,
                     "distribution": emotion_percentages,
-                    "most_common": max(emotion_counts.items(), key=lambda x: x[1])[0] if emotion_counts else "neutral"
+                    "most_common": next(iter(emotion_counts), "neutral")
                 },
                 "recent_activity": {
                     "sessions_last_7_days": recent_sessions,
                     "mood_entries_last_7_days": recent_mood_entries
                 }
             }
+            _overview_cache.set(days, overview)
+            return overview
             
         except Exception as e:
             logger.error(f"Error getting analytics overview: {e}")
@@ -123,18 +135,20 @@ async def get_emotion_trends(
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # Get mood entries grouped by day
-            mood_entries = db.query(MoodEntry).filter(
+            # Mood entries counted per day and emotion by the database
+            day = func.date(MoodEntry.timestamp)
+            daily_counts = db.query(
+                day,
+                MoodEntry.emotion,
+                func.count(MoodEntry.id)
+            ).filter(
                 MoodEntry.timestamp >= start_date
-            ).order_by(MoodEntry.timestamp).all()
+            ).group_by(day, MoodEntry.emotion).order_by(day).all()
             
             # Group by date and emotion
             daily_emotions = {}
-            for entry in mood_entries:
-                date_key = entry.timestamp.date().isoformat()
-                if date_key not in daily_emotions:
-                    daily_emotions[date_key] = {}
-                daily_emotions[date_key][entry.emotion] = daily_emotions[date_key].get(entry.emotion, 0) + 1
+            for date_key, emotion, count in daily_counts:
+                daily_emotions.setdefault(str(date_key), {})[emotion] = count
             
             # Calculate trends
             trends = []
@@ -175,37 +189,54 @@ async def get_session_analytics(
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # Get sessions
-            sessions = db.query(TherapySession).filter(
+            # Only the columns read below, as plain tuples rather than full ORM objects
+            sessions = db.query(
+                TherapySession.status,
+                TherapySession.session_type,
+                TherapySession.started_at
+            ).filter(
                 TherapySession.started_at >= start_date
             ).all()
             
             # Calculate metrics
             total_sessions = len(sessions)
-            completed_sessions = len([s for s in sessions if s.status == "completed"])
-            active_sessions = len([s for s in sessions if s.status == "active"])
-            
-            # Duration analysis
-            sessions_with_duration = [s for s in sessions if s.duration_minutes is not None]
-            durations = [s.duration_minutes for s in sessions_with_duration]
-            
-            duration_stats = {
-                "average": sum(durations) / len(durations) if durations else 0,
-                "min": min(durations) if durations else 0,
-                "max": max(durations) if durations else 0,
-                "median": sorted(durations)[len(durations)//2] if durations else 0
-            }
+            completed_sessions = len([status for status, _, _ in sessions if status == "completed"])
+            active_sessions = len([status for status, _, _ in sessions if status == "active"])
+            
+            # Duration analysis, aggregated by the database
+            duration = TherapySession.duration_minutes
+            duration_window = (TherapySession.started_at >= start_date, duration.isnot(None))
+            duration_count, average, shortest, longest = db.query(
+                func.count(duration), func.avg(duration), func.min(duration), func.max(duration)
+            ).filter(*duration_window).one()
+            
+            duration_stats = {"average": 0, "min": 0, "max": 0, "median": 0, "p95": 0}
+            if duration_count:
+                # Order statistics by offset, matching sorted(durations)[k], fetched together in one round-trip
+                def nth_duration(k: int):
+                    return select(duration).where(*duration_window).order_by(duration).offset(k).limit(1).scalar_subquery()
+                
+                median, p95 = db.query(
+                    nth_duration(duration_count // 2),
+                    nth_duration(int(duration_count * 0.95))
+                ).one()
+                duration_stats = {
+                    "average": float(average),
+                    "min": shortest,
+                    "max": longest,
+                    "median": median,
+                    "p95": p95
+                }
             
             # Session types
             session_types = {}
-            for session in sessions:
-                session_type = session.session_type
+            for _, session_type, _ in sessions:
                 session_types[session_type] = session_types.get(session_type, 0) + 1
             
             # Daily session counts
             daily_sessions = {}
-            for session in sessions:
-                date_key = session.started_at.date().isoformat()
+            for _, _, started_at in sessions:
+                date_key = started_at.date().isoformat()
                 daily_sessions[date_key] = daily_sessions.get(date_key, 0) + 1
             
             return {
@@ -231,96 +262,125 @@ async def get_session_analytics(
 
 @router.get("/users/engagement")
 async def get_user_engagement(
-    days: int = Query(30, description="Number of days to analyze"),
+    # The daily snapshot only reaches back as far as it was backfilled
+    days: int = Query(30, ge=1, le=DAILY_STATS_BACKFILL_DAYS, description="Number of days to analyze"),
     db: Session = Depends(get_database)
 ):
     """Get user engagement metrics."""
     
     with LogContext(logger, endpoint="user_engagement", days=days):
         try:
-            end_date = datetime.now()
+            # Snapshot days are UTC days
+            end_date = datetime.utcnow()
             start_date = end_date - timedelta(days=days)
             
-            # Get users who were active in the period
-            active_users = db.query(User).filter(
+            # Per-user totals come from the daily snapshot: at most days + 1 rows per user instead of the raw tables
+            user_stats = db.query(
+                DailyUserStats.user_id.label("user_id"),
+                func.sum(DailyUserStats.session_count).label("sessions"),
+                func.sum(DailyUserStats.mood_entry_count).label("mood_entries"),
+                func.max(DailyUserStats.last_session_at).label("last_session"),
+                func.max(DailyUserStats.last_mood_at).label("last_mood")
+            ).filter(
+                DailyUserStats.day >= start_date.date()
+            ).group_by(DailyUserStats.user_id).subquery()
+            
+            sessions_count = func.coalesce(user_stats.c.sessions, 0)
+            mood_entries_count = func.coalesce(user_stats.c.mood_entries, 0)
+            engagement_score = sessions_count * 0.7 + mood_entries_count * 0.3
+            
+            # Scoring, ranking and the population totals (window aggregates, taken before LIMIT) all happen in SQL
+            top_users = db.query(
+                User.id,
+                User.username,
+                sessions_count,
+                mood_entries_count,
+                engagement_score,
+                user_stats.c.last_session,
+                user_stats.c.last_mood,
+                func.count().over(),
+                func.avg(engagement_score).over()
+            ).outerjoin(
+                user_stats, user_stats.c.user_id == User.id
+            ).filter(
                 User.is_active == True
-            ).all()
+            ).order_by(desc(engagement_score)).limit(50).all()  # Top 50 users
+            
+            total_active_users, average_engagement = (top_users[0][-2], float(top_users[0][-1])) if top_users else (0, 0)
             
-            # Calculate engagement metrics for each user
             user_engagement = []
-            for user in active_users:
-                # Get user's sessions in the period
-                user_sessions = db.query(TherapySession).filter(
-                    TherapySession.user_id == user.id,
-                    TherapySession.started_at >= start_date
-                ).all()
-                
-                # Get user's mood entries
-                user_mood_entries = db.query(MoodEntry).filter(
-                    MoodEntry.user_id == user.id,
-                    MoodEntry.timestamp >= start_date
-                ).all()
-                
-                engagement_score = len(user_sessions) * 0.7 + len(user_mood_entries) * 0.3
+            for user_id, username, sessions, mood_entries, score, last_session, last_mood, _, _ in top_users:
+                last_activity = max(filter(None, (last_session, last_mood)), default=None)
                 
                 user_engagement.append({
-                    "user_id": str(user.id),
-                    "username": user.username,
-                    "sessions_count": len(user_sessions),
-                    "mood_entries_count": len(user_mood_entries),
-                    "engagement_score": round(engagement_score, 2),
-                    "last_activity": max(
-                        [s.started_at for s in user_sessions] + 
-                        [m.timestamp for m in user_mood_entries],
-                        default=None
-                    ).isoformat() if user_sessions or user_mood_entries else None
+                    "user_id": str(user_id),
+                    "username": username,
+                    "sessions_count": int(sessions),
+                    "mood_entries_count": int(mood_entries),
+                    "engagement_score": round(float(score), 2),
+                    "last_activity": last_activity.isoformat() if last_activity else None
                 })
             
-            # Sort by engagement score
-            user_engagement.sort(key=lambda x: x["engagement_score"], reverse=True)
-            
             return {
                 "period": {
                     "start_date": start_date.isoformat(),
                     "end_date": end_date.isoformat(),
                     "days": days
                 },
-                "total_active_users": len(active_users),
-                "user_engagement": user_engagement[:50],  # Top 50 users
-                "average_engagement": sum(u["engagement_score"] for u in user_engagement) / len(user_engagement) if user_engagement else 0
+                "total_active_users": total_active_users,
+                "user_engagement": user_engagement,
+                "average_engagement": average_engagement
             }
             
         except Exception as e:
             logger.error(f"Error getting user engagement: {e}")
             raise DatabaseError("Failed to retrieve user engagement metrics")
 
+def _count(model, *criteria) -> int:
+    """Count rows of model matching criteria on a pooled session of its own, so counts can run concurrently."""
+    db = SessionLocal()
+    try:
+        return db.query(func.count()).select_from(model).filter(*criteria).scalar()
+    finally:
+        db.close()
+
 @router.get("/health/metrics")
-async def get_health_metrics(db: Session = Depends(get_database)):
+async def get_health_metrics():
     """Get system health metrics."""
     
     with LogContext(logger, endpoint="health_metrics"):
         try:
+            # Recent activity (last hour); one clock reading serves the cutoff and the timestamp
+            now = datetime.now()
+            recent_start = now - timedelta(hours=1)
+            
+            # The six counts are independent, so they run side by side on separate pool connections
+            (
+                users_count, sessions_count, mood_entries_count, interactions_count,
+                sessions_last_hour, mood_entries_last_hour
+            ) = await asyncio.gather(
+                asyncio.to_thread(_count, User),
+                asyncio.to_thread(_count, TherapySession),
+                asyncio.to_thread(_count, MoodEntry),
+                asyncio.to_thread(_count, Interaction),
+                asyncio.to_thread(_count, TherapySession, TherapySession.started_at >= recent_start),
+                asyncio.to_thread(_count, MoodEntry, MoodEntry.timestamp >= recent_start)
+            )
+            
             # Database health
             db_health = {
-                "users_count": db.query(User).count(),
-                "sessions_count": db.query(TherapySession).count(),
-                "mood_entries_count": db.query(MoodEntry).count(),
-                "interactions_count": db.query(Interaction).count()
+                "users_count": users_count,
+                "sessions_count": sessions_count,
+                "mood_entries_count": mood_entries_count,
+                "interactions_count": interactions_count
             }
-            
-            # Recent activity (last hour)
-            recent_start = datetime.now() - timedelta(hours=1)
             recent_activity = {
-                "sessions_last_hour": db.query(TherapySession).filter(
-                    TherapySession.started_at >= recent_start
-                ).count(),
-                "mood_entries_last_hour": db.query(MoodEntry).filter(
-                    MoodEntry.timestamp >= recent_start
-                ).count()
+                "sessions_last_hour": sessions_last_hour,
+                "mood_entries_last_hour": mood_entries_last_hour
             }
             
             return {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "database_health": db_health,
                 "recent_activity": recent_activity,
                 "status": "healthy"
@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from datetime import datetime
 from ..models.schemas import AudioRequest, TherapeuticResponse
-from ..models.database import get_database
+from ..models.database import get_database, hash_base64_audio
+from ..core.security import validate_audio_request
+from ..core.logging import get_logger
 from ..services import tts
 from ..services.emotion_detector import emotion_detector
 from ..services.audio_processor import audio_processor
@@ -22,6 +24,7 @@ from ..services.adaptive_response_system import AdaptiveResponseSystem
 from ..services.emotional_intelligence_engine import EmotionalIntelligenceEngine
 
 router = APIRouter()
+logger = get_logger('voice-cbt.audio')
 
 # Initialize advanced services
 response_optimizer = ResponseOptimizer()
@@ -89,12 +92,14 @@ async def generate_enhanced_voice(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/session/start", response_model=TherapeuticResponse)
-async def start_session(request: AudioRequest, db = Depends(get_database)):
+async def start_session(request: AudioRequest = Depends(validate_audio_request), db = Depends(get_database)):
     """
     Receives user's voice input, processes it, and returns a therapeutic response.
     """
     start_time = datetime.now()
-    db_service = DatabaseService(db)
+    # Writes are grouped into short transactions so no write lock is held across STT, emotion or LLM calls
+    db_service = DatabaseService(db, autocommit=False)
+    user_id = session_id = None
     
     try:
         # Create or get user
@@ -102,17 +107,39 @@ async def start_session(request: AudioRequest, db = Depends(get_database)):
             username=request.user_id or "anonymous",
             email=None
         )
+        user_id = str(user.id)
+        user_preferences = user.preferences or {}
         
         # Start or get existing session
-        session_data = db_service.start_therapy_session(str(user.id))
+        session_data = db_service.start_therapy_session(user_id)
+        if not db_service.commit():
+            raise HTTPException(status_code=500, detail="Failed to save session")
         session_id = session_data["session_id"] if session_data else None
         
         # Initialize variables
         processed_audio = None
         temp_file_path = None
+        audio_hash = None
+        stored_interaction = None
         
-        # Determine input type and process accordingly
         if request.audio_data:
+            # Only a hash of the upload is stored, taken over the base64 text so the payload isn't
+            # decoded an extra time. The same audio uploaded again reuses the transcript and emotion
+            # analysed for it instead of running STT and detection again; the exchange itself is
+            # still logged as a new interaction of this session
+            try:
+                audio_hash = hash_base64_audio(request.audio_data)
+                stored_interaction = db_service.get_interaction_by_audio_hash(user_id, audio_hash)
+            except ValueError as e:
+                logger.warning("Audio hashing failed: %s", e)
+        
+        # Determine input type and process accordingly
+        if stored_interaction:
+            transcribed_text = stored_interaction["transcribed_text"]
+            emotion_label = stored_interaction["detected_emotion"]
+            emotion_confidence = stored_interaction["confidence"] or 0.0
+            logger.info("Reusing stored analysis for repeated audio: %s (confidence: %.2f)", emotion_label, emotion_confidence)
+        elif request.audio_data:
             # Step 1: Process audio for transcription
             print("Processing audio...")
             try:
@@ -132,12 +159,14 @@ async def start_session(request: AudioRequest, db = Depends(get_database)):
                 # Fallback to a default message if transcription fails
                 transcribed_text = "I'm having trouble understanding. Could you please repeat that?"
                 print(f"Transcription failed or empty: {transcribed_text}")
+                # Don't let a retry of this audio reuse the failed transcript
+                audio_hash = None
             else:
                 print(f"Transcribed text: {transcribed_text}")
 
             # Step 3: Detect emotion from the audio using the trained model
             print("Detecting emotion...")
-            emotion_result = emotion_detector.detect_emotion_from_base64(request.audio_data)
+            emotion_result = await emotion_detector.detect_emotion_from_base64_async(request.audio_data)
             emotion_label = emotion_result["emotion"]
             emotion_confidence = emotion_result.get("confidence", 0.0)
             print(f"Detected emotion: {emotion_label} (confidence: {emotion_confidence:.2f})")
@@ -166,18 +195,16 @@ async def start_session(request: AudioRequest, db = Depends(get_database)):
         # Generate or get session ID for conversation memory
         if not session_id:
             session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            conversation_memory.start_session(session_id, str(user.id) if user else None)
+            conversation_memory.start_session(session_id, user_id)
         
         # Get conversation history for context
         conversation_history = conversation_memory.get_session_history(session_id)
         
         # Get user profile for personalization
-        user_profile = None
-        if user:
-            user_profile = {
-                "preferences": user.preferences or {},
-                "therapy_style": user.preferences.get("therapy_style", "supportive") if user.preferences else "supportive"
-            }
+        user_profile = {
+            "preferences": user_preferences,
+            "therapy_style": user_preferences.get("therapy_style", "supportive")
+        }
         
         # Generate enhanced response
         enhanced_response = generate_enhanced_response(
@@ -199,27 +226,28 @@ async def start_session(request: AudioRequest, db = Depends(get_database)):
         conversation_memory.add_exchange(session_id, transcribed_text, emotion_label, response_text)
         
         # Track progress and mood
-        user_id = str(user.id) if user else "anonymous"
         progress_tracker.track_mood(user_id, emotion_label, emotion_confidence, session_id, transcribed_text)
 
         # Step 5: Log interaction to database
+        processing_time = (datetime.now() - start_time).total_seconds() * 1000
         if session_id:
             interaction_data = {
                 "transcribed_text": transcribed_text,
                 "detected_emotion": emotion_label,
                 "emotion_confidence": emotion_confidence,
                 "therapeutic_response": response_text,
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
+                "processing_time_ms": int(processing_time),
                 "model_version": "1.0"
             }
-            db_service.log_interaction(session_id, str(user.id), **interaction_data)
+            db_service.log_interaction(session_id, user_id, audio_data_hash=audio_hash, **interaction_data)
+            if not db_service.commit():
+                raise HTTPException(status_code=500, detail="Failed to save interaction")
 
         # Step 6: Clean up temporary files
         if temp_file_path:
             audio_processor.cleanup_temp_file(temp_file_path)
 
-        # Step 7: Log system metrics
-        processing_time = (datetime.now() - start_time).total_seconds() * 1000
+        # Step 7: Log system metrics (queued for the background metrics writer, not this transaction)
         db_service.log_system_metrics(
             response_time_ms=int(processing_time),
             active_sessions=1,
@@ -268,11 +296,15 @@ async def start_session(request: AudioRequest, db = Depends(get_database)):
         )
     except Exception as e:
         print(f"Error in start_session: {e}")
-        # Log error to database
-        if 'session_id' in locals() and session_id:
-            db_service.log_interaction(session_id, str(user.id), 
+        # Discard any half-written rows before recording the error on its own
+        db.rollback()
+        if session_id:
+            db_service.log_interaction(session_id, user_id,
                                      error_message=str(e),
                                      processing_time_ms=int((datetime.now() - start_time).total_seconds() * 1000))
+            db_service.commit()
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/transcribe", response_model=dict)
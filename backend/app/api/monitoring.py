@@ -121,72 +121,56 @@ async def get_usage_analytics(
 ):
     """Get usage analytics."""
     try:
-        db_service = DatabaseService(db)
-        
         # Get usage data from database
         try:
-            from ..models.database import get_database
-            from ..services.database_service import DatabaseService
-            from sqlalchemy import func, desc
-            from ..models.database import Session, User, MoodEntry
-            
-            db = next(get_database())
-            db_service = DatabaseService(db)
+            from sqlalchemy import func, desc, distinct, select
+            from ..models.database import TherapySession, User, MoodEntry, Interaction
             
             # Calculate date range
-            from datetime import datetime, timedelta
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # Get actual data from database
-            total_sessions = db.query(Session).filter(
-                Session.created_at >= start_date,
-                Session.created_at <= end_date
-            ).count()
-            
-            total_interactions = db.query(Session).filter(
-                Session.created_at >= start_date,
-                Session.created_at <= end_date
-            ).with_entities(func.sum(Session.interaction_count)).scalar() or 0
-            
-            unique_users = db.query(User).filter(
-                User.created_at >= start_date,
-                User.created_at <= end_date
-            ).count()
-            
-            # Calculate average session duration
-            sessions = db.query(Session).filter(
-                Session.created_at >= start_date,
-                Session.created_at <= end_date
-            ).all()
-            
-            avg_duration = 0
-            if sessions:
-                total_duration = sum([
-                    (session.updated_at - session.created_at).total_seconds() 
-                    for session in sessions if session.updated_at
-                ])
-                avg_duration = total_duration / len(sessions) / 60  # Convert to minutes
+            # Session, interaction and user totals come back as scalar subqueries in one round-trip
+            session_window = (
+                TherapySession.started_at >= start_date,
+                TherapySession.started_at <= end_date
+            )
+            total_sessions, avg_duration, total_interactions, unique_users = db.query(
+                select(func.count(TherapySession.id)).where(*session_window).scalar_subquery(),
+                select(func.avg(TherapySession.duration_minutes)).where(*session_window).scalar_subquery(),
+                select(func.count(Interaction.id)).where(
+                    Interaction.timestamp >= start_date,
+                    Interaction.timestamp <= end_date
+                ).scalar_subquery(),
+                select(func.count(User.id)).where(
+                    User.created_at >= start_date,
+                    User.created_at <= end_date
+                ).scalar_subquery()
+            ).one()
+            avg_duration = float(avg_duration or 0)
             
             # Get most common emotions
             emotion_counts = db.query(
-                MoodEntry.emotion_label,
-                func.count(MoodEntry.emotion_label)
+                MoodEntry.emotion,
+                func.count(MoodEntry.id)
             ).filter(
                 MoodEntry.timestamp >= start_date,
                 MoodEntry.timestamp <= end_date
-            ).group_by(MoodEntry.emotion_label).order_by(desc(func.count(MoodEntry.emotion_label))).limit(5).all()
+            ).group_by(MoodEntry.emotion).order_by(desc(func.count(MoodEntry.id))).limit(5).all()
             
             most_common_emotions = [{"emotion": emotion, "count": count} for emotion, count in emotion_counts]
             
-            # Calculate peak usage hours
+            # Peak usage hours from the interaction log, grouped by the database (at most 24 groups);
+            # each hour still reports the sessions active in it, as the response always has
+            interaction_hour = func.extract('hour', Interaction.timestamp)
+            active_sessions = func.count(distinct(Interaction.session_id))
             hour_counts = db.query(
-                func.extract('hour', Session.created_at),
-                func.count(Session.id)
+                interaction_hour,
+                active_sessions
             ).filter(
-                Session.created_at >= start_date,
-                Session.created_at <= end_date
-            ).group_by(func.extract('hour', Session.created_at)).order_by(desc(func.count(Session.id))).limit(3).all()
+                Interaction.timestamp >= start_date,
+                Interaction.timestamp <= end_date
+            ).group_by(interaction_hour).order_by(desc(active_sessions)).limit(3).all()
             
             peak_usage_hours = [{"hour": int(hour), "sessions": int(count)} for hour, count in hour_counts]
             
@@ -0,0 +1,59 @@
+"""
+In-process caching helpers for Voice CBT application.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire ttl_seconds after they are stored.
+    
+    Values are deep-copied on the way in and out unless copy_values is False, so callers
+    can't mutate what later requests are served.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float, copy_values: bool = True):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.copy_values = copy_values
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a live entry and mark it most recently used, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, cached_at = entry
+            if time.monotonic() - cached_at >= self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value) if self.copy_values else value
+    
+    def set(self, key: Hashable, value: Any):
+        if self.copy_values:
+            value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+    
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -2,7 +2,10 @@
 Custom exceptions and error handling for Voice CBT application.
 """
 
+from functools import cached_property
 from typing import Optional, Dict, Any
+import logging
+import sys
 import traceback
 from .logging import get_logger
 
@@ -16,14 +19,28 @@ class VoiceCBTException(Exception):
         self.message = message
         self.error_code = error_code or "UNKNOWN_ERROR"
         self.details = details or {}
-        self.traceback = traceback.format_exc()
+        # Keep a frame summary rather than the exc_info tuple: the traceback would keep every frame
+        # it passes through (and their locals) alive for as long as this exception is referenced
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        self._handled = traceback.TracebackException(
+            exc_type, exc_value, exc_tb, lookup_lines=False
+        ) if exc_type is not None else None
+        del exc_type, exc_value, exc_tb
         
-        # Log the exception
-        logger.error(f"VoiceCBTException: {message}", extra={
-            'error_code': error_code,
-            'details': details,
-            'traceback': self.traceback
-        })
+        # Log the exception (skip formatting entirely when ERROR is filtered out)
+        if logger.isEnabledFor(logging.ERROR):
+            logger.error(f"VoiceCBTException: {message}", extra={
+                'error_code': error_code,
+                'details': details,
+                'traceback': self.traceback
+            })
+    
+    @cached_property
+    def traceback(self) -> str:
+        """Formatted traceback of the exception being handled when this was raised."""
+        if self._handled is None:
+            return "NoneType: None\n"
+        return "".join(self._handled.format())
 
 class AuthenticationError(VoiceCBTException):
     """Authentication related errors."""
@@ -7,7 +7,10 @@ import logging
 import logging.handlers
 import os
 import sys
+import threading
+import time
 from datetime import datetime
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Optional, Dict, Any
 import json
@@ -60,6 +63,76 @@ class JSONFormatter(logging.Formatter):
         
         return json.dumps(log_entry)
 
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that batches writes instead of flushing every record.
+    
+    A daemon thread flushes the buffer every flush_interval seconds and records at
+    flush_level or above are flushed immediately, so a hard crash loses at most the
+    last flush_interval seconds of lower-level records. A normal exit flushes
+    everything through logging.shutdown().
+    """
+    
+    def __init__(self, filename, maxBytes: int = 0, backupCount: int = 0,
+                 buffer_size: int = 1024 * 1024, flush_interval: float = 1.0,
+                 flush_level: int = logging.ERROR, **kwargs):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._bytes_written = 0
+        self._pending_bytes = 0
+        self._last_flush = time.monotonic()
+        self._stop_flushing = threading.Event()
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, **kwargs)
+        # Flushes a quiet log too, where no new record would trigger the interval check
+        self._flush_thread = threading.Thread(target=self._flush_periodically, name="log-flush", daemon=True)
+        self._flush_thread.start()
+    
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                      encoding=self.encoding, errors=self.errors)
+        stream.seek(0, 2)
+        self._bytes_written = stream.tell()
+        return stream
+    
+    def shouldRollover(self, record) -> bool:
+        # Track the file size ourselves; seek/tell would flush the buffer on every record
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes <= 0:
+            return False
+        # Measure encoded bytes: non-ASCII text takes more bytes than characters in the file
+        line = "%s\n" % self.format(record)
+        self._pending_bytes = len(line.encode(self.encoding or "utf-8", self.errors or "strict"))
+        return self._bytes_written + self._pending_bytes >= self.maxBytes
+    
+    def emit(self, record):
+        super().emit(record)
+        self._bytes_written += self._pending_bytes
+        if record.levelno >= self.flush_level:
+            self._flush_stream()
+    
+    def flush(self):
+        # Called by StreamHandler.emit after every record; only hit the disk once per interval
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_stream()
+    
+    def _flush_stream(self):
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+            self._last_flush = time.monotonic()
+        finally:
+            self.release()
+    
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.flush_interval):
+            self._flush_stream()
+    
+    def close(self):
+        self._stop_flushing.set()
+        super().close()
+
 def setup_logging(
     log_level: str = "INFO",
     log_file: Optional[str] = None,
@@ -107,7 +180,7 @@ def setup_logging(
     
     # File handler
     if log_file:
-        file_handler = logging.handlers.RotatingFileHandler(
+        file_handler = BufferedRotatingFileHandler(
             log_file,
             maxBytes=10*1024*1024,  # 10MB
             backupCount=5
@@ -125,7 +198,7 @@ def setup_logging(
         logger.addHandler(file_handler)
     
     # Error handler (separate file for errors)
-    error_handler = logging.handlers.RotatingFileHandler(
+    error_handler = BufferedRotatingFileHandler(
         logs_dir / "errors.log",
         maxBytes=5*1024*1024,  # 5MB
         backupCount=3
@@ -142,31 +215,33 @@ def get_logger(name: str = 'voice-cbt') -> logging.Logger:
     """Get a logger instance."""
     return logging.getLogger(name)
 
+# Per-task structured logging context, read by a single record factory
+_log_context: ContextVar[Dict[str, Any]] = ContextVar('voice_cbt_log_context', default={})
+_base_record_factory = logging.getLogRecordFactory()
+
+def _context_record_factory(*args, **kwargs):
+    record = _base_record_factory(*args, **kwargs)
+    for key, value in _log_context.get().items():
+        setattr(record, key, value)
+    return record
+
+logging.setLogRecordFactory(_context_record_factory)
+
 class LogContext:
     """Context manager for adding structured logging context."""
     
     def __init__(self, logger: logging.Logger, **context):
         self.logger = logger
         self.context = context
-        self.old_factory = None
+        self.token = None
     
     def __enter__(self):
-        # Store old record factory
-        self.old_factory = logging.getLogRecordFactory()
-        
-        # Create new factory with context
-        def record_factory(*args, **kwargs):
-            record = self.old_factory(*args, **kwargs)
-            for key, value in self.context.items():
-                setattr(record, key, value)
-            return record
-        
-        logging.setLogRecordFactory(record_factory)
+        # Layer our context over the enclosing one for the current task only
+        self.token = _log_context.set({**_log_context.get(), **self.context})
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # Restore old factory
-        logging.setLogRecordFactory(self.old_factory)
+        _log_context.reset(self.token)
 
 # Global logger instance
 logger = setup_logging(
@@ -2,9 +2,9 @@
 Production configuration management for Voice CBT application.
 """
 
-import os
 import secrets
-import string
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import Optional, List
 from pydantic_settings import BaseSettings
 from pydantic import Field, validator
@@ -57,7 +57,7 @@ class ProductionSettings(BaseSettings):
     # Security Configuration
     JWT_SECRET_KEY: str = Field(..., description="JWT secret key")
     JWT_ALGORITHM: str = Field(default="HS256", description="JWT algorithm")
-    JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=30, description="JWT token expiry")
+    JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=15, description="JWT token expiry")
     ENCRYPTION_KEY: str = Field(..., description="Encryption key for sensitive data")
     CORS_ORIGINS: List[str] = Field(default=["*"], description="CORS allowed origins")
     
@@ -138,20 +138,20 @@ class ProductionSettings(BaseSettings):
         case_sensitive = True
 
 def generate_secret_key(length: int = 32) -> str:
-    """Generate a secure random secret key."""
-    alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
+    """Generate a secure random secret key from a single CSPRNG read."""
+    return secrets.token_urlsafe(length)[:length]
 
 def create_production_env_file(env_file_path: str = "config.production.env"):
     """Create a production environment file with secure defaults."""
     
-    # Generate secure keys
-    jwt_secret = generate_secret_key(64)
-    encryption_key = generate_secret_key(64)
-    db_password = generate_secret_key(32)
+    # Generate secure keys (each draws from the OS CSPRNG independently)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        jwt_secret, encryption_key, db_password = executor.map(generate_secret_key, (64, 64, 32))
+    
+    generated_at = datetime.now(timezone.utc).isoformat()
     
     env_content = f"""# Voice CBT Production Environment Configuration
-# Generated on {os.popen('date').read().strip()}
+# Generated on {generated_at}
 
 # Database Configuration
 DATABASE_URL=postgresql+asyncpg://voicecbt_user:{db_password}@${{DB_HOST}}:5432/voicecbt_prod
@@ -198,7 +198,7 @@ LOG_FILE=/app/logs/voice_cbt.log
 # Security Configuration
 JWT_SECRET_KEY={jwt_secret}
 JWT_ALGORITHM=HS256
-JWT_ACCESS_TOKEN_EXPIRE_MINUTES=30
+JWT_ACCESS_TOKEN_EXPIRE_MINUTES=15
 ENCRYPTION_KEY={encryption_key}
 CORS_ORIGINS=https://yourdomain.com,https://www.yourdomain.com
 
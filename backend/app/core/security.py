@@ -3,48 +3,158 @@ Advanced security features for Voice CBT application.
 """
 
 import os
+import base64
+import binascii
 import hashlib
 import secrets
 import string
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+import jwt
+from jwt import PyJWTError
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from ..models.schemas import AudioRequest
+from .cache import TTLCache
 import re
 import ipaddress
+import logging
+import heapq
+import threading
+from collections import deque
 from functools import wraps
 import time
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context with an explicit bcrypt work factor
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS, deprecated="auto")
 
 # JWT Configuration
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Access tokens are short-lived and rotated via refresh_token, so bcrypt is only paid at login
+JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 
 # Security settings
 MAX_LOGIN_ATTEMPTS = 5
 LOCKOUT_DURATION_MINUTES = 15
 RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
 RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "3600"))
+SUSPICIOUS_IP_REQUESTS = 50  # More than 50 requests...
+SUSPICIOUS_IP_WINDOW = 60    # ...per minute from one IP
+TRACKER_SWEEP_INTERVAL = 60  # Seconds between sweeps of expired in-memory windows
 
-# In-memory storage for security tracking (use Redis in production)
-_login_attempts = {}
-_rate_limit_tracker = {}
+# Audio upload validation
+MAX_AUDIO_BYTES = 50 * 1024 * 1024
+_BASE64_WHITESPACE = (" ", "\t", "\r", "\n")
+AUDIO_MAGIC_NUMBERS = (b'RIFF', b'ID3', b'\xff\xfb', b'\xff\xf3')  # WAV, MP3 (ID3 tag / frame sync)
+
+# Password character classes as bitflags, looked up per character in a single pass
+_HAS_UPPER, _HAS_LOWER, _HAS_DIGIT, _HAS_SPECIAL = 1, 2, 4, 8
+_ALL_CHAR_CLASSES = _HAS_UPPER | _HAS_LOWER | _HAS_DIGIT | _HAS_SPECIAL
+_CHAR_CLASS_FLAGS = {
+    **dict.fromkeys(string.ascii_uppercase, _HAS_UPPER),
+    **dict.fromkeys(string.ascii_lowercase, _HAS_LOWER),
+    **dict.fromkeys(string.digits, _HAS_DIGIT),
+    **dict.fromkeys('!@#$%^&*(),.?":{}|<>', _HAS_SPECIAL)
+}
+_COMMON_PASSWORD_RE = re.compile(
+    r'(.)\1{2,}'            # Repeated characters
+    r'|123|abc|qwe'         # Sequential patterns
+    r'|password|admin|user',  # Common words
+    re.IGNORECASE
+)
+_UNSAFE_INPUT_RE = re.compile(r'[<>"\']')
+
+# Redis configuration for shared security state (optional)
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") or None
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_KEY_PREFIX = "voice_cbt:security:"
+
+logger = logging.getLogger(__name__)
+
+# Fixed-window counters, atomically: the per-endpoint limit (KEYS[1]) and the per-IP minute
+# counter behind is_suspicious_ip (KEYS[2]). A new endpoint window is also registered in the
+# KEYS[3] sorted set, scored by its expiry, so reports can count live windows without a SCAN.
+# ARGV: rate window seconds, suspicious-IP window seconds, current epoch seconds
+_RATE_LIMIT_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('ZADD', KEYS[3], tonumber(ARGV[3]) + tonumber(ARGV[1]), KEYS[1])
+end
+if redis.call('INCR', KEYS[2]) == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+return count
+"""
+
+def _sweep_request_trackers(current_time: float):
+    """Drop expired fixed windows, at most once per TRACKER_SWEEP_INTERVAL, so the trackers only
+    hold clients seen within their window instead of every client ever seen."""
+    global _last_tracker_sweep
+    if current_time - _last_tracker_sweep < TRACKER_SWEEP_INTERVAL:
+        return
+    _last_tracker_sweep = current_time
+    
+    for tracker, window_seconds in ((_rate_limit_tracker, RATE_LIMIT_WINDOW), (_ip_request_tracker, SUSPICIOUS_IP_WINDOW)):
+        # Snapshot the items, since other requests may add windows while this runs
+        for key, window in list(tracker.items()):
+            if current_time - window["window_start"] >= window_seconds:
+                tracker.pop(key, None)
+
+def _create_redis_client():
+    """Create the shared Redis client, or None when Redis is not configured."""
+    if not REDIS_HOST:
+        return None
+    
+    try:
+        import redis
+    except ImportError:
+        logger.warning("REDIS_HOST is set but the redis package is not installed; using in-memory security state")
+        return None
+    
+    return redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        db=REDIS_DB,
+        decode_responses=True,
+        socket_timeout=0.5
+    )
+
+# In-memory storage for security tracking (used when Redis is not configured)
+_login_attempts = {}  # (client_ip, username) -> attempt data
+_rate_limit_tracker = {}  # (client_ip, endpoint) -> fixed window
+_ip_request_tracker = {}
+_last_tracker_sweep = 0.0
 _blocked_ips = set()
-_suspicious_activities = []
+_suspicious_activities = deque(maxlen=1000)  # Keep only last 1000 activities
+
+# Short-lived cache of decoded JWT payloads keyed by the raw token
+TOKEN_CACHE_MAX_SIZE = 10000
+TOKEN_CACHE_TTL_SECONDS = 5
+_token_cache = TTLCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl_seconds=TOKEN_CACHE_TTL_SECONDS, copy_values=False)
+
+# Token IDs retired by refresh rotation, mapped to their original expiry; the heap orders
+# them by expiry so pruning only touches entries that have actually expired
+_revoked_token_ids = {}
+_revoked_token_expiries = []  # (exp, jti) min-heap
+_revoked_token_lock = threading.Lock()
 
 class SecurityManager:
     """Advanced security manager for the application."""
     
-    def __init__(self):
+    def __init__(self, redis_client=None):
         self.pwd_context = pwd_context
         self.jwt_secret = JWT_SECRET_KEY
         self.jwt_algorithm = JWT_ALGORITHM
+        self.redis = redis_client
+        self._rate_limit_script = redis_client.register_script(_RATE_LIMIT_SCRIPT) if redis_client else None
     
     # Password Security
     def hash_password(self, password: str) -> str:
@@ -52,7 +162,7 @@ class SecurityManager:
         return self.pwd_context.hash(password)
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash."""
+        """Verify a password against its hash. Only login should call this; other requests use the JWT."""
         return self.pwd_context.verify(plain_password, hashed_password)
     
     def validate_password_strength(self, password: str) -> Dict[str, Any]:
@@ -65,38 +175,27 @@ class SecurityManager:
         else:
             score += 1
         
-        if not re.search(r'[A-Z]', password):
-            issues.append("Password must contain at least one uppercase letter")
-        else:
-            score += 1
+        # Classify every character once; non-ASCII decimal digits still count as digits
+        flags = 0
+        for char in password:
+            flags |= _CHAR_CLASS_FLAGS.get(char) or (_HAS_DIGIT if char.isdecimal() else 0)
+            if flags == _ALL_CHAR_CLASSES:
+                break
         
-        if not re.search(r'[a-z]', password):
+        if not flags & _HAS_UPPER:
+            issues.append("Password must contain at least one uppercase letter")
+        if not flags & _HAS_LOWER:
             issues.append("Password must contain at least one lowercase letter")
-        else:
-            score += 1
-        
-        if not re.search(r'\d', password):
+        if not flags & _HAS_DIGIT:
             issues.append("Password must contain at least one digit")
-        else:
-            score += 1
-        
-        if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+        if not flags & _HAS_SPECIAL:
             issues.append("Password must contain at least one special character")
-        else:
-            score += 1
+        score += bin(flags).count("1")
         
         # Check for common patterns
-        common_patterns = [
-            r'(.)\1{2,}',  # Repeated characters
-            r'123|abc|qwe',  # Sequential patterns
-            r'password|admin|user',  # Common words
-        ]
-        
-        for pattern in common_patterns:
-            if re.search(pattern, password, re.IGNORECASE):
-                issues.append("Password contains common patterns")
-                score -= 1
-                break
+        if _COMMON_PASSWORD_RE.search(password):
+            issues.append("Password contains common patterns")
+            score -= 1
         
         strength_levels = {
             0: "Very Weak",
@@ -123,56 +222,144 @@ class SecurityManager:
         else:
             expire = datetime.utcnow() + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        to_encode.update({"exp": expire, "iat": datetime.utcnow()})
+        to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": secrets.token_urlsafe(16)})
         encoded_jwt = jwt.encode(to_encode, self.jwt_secret, algorithm=self.jwt_algorithm)
         return encoded_jwt
     
     def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
-        """Verify and decode a JWT token."""
+        """Verify and decode a JWT token, reusing recently decoded payloads."""
+        current_time = time.time()
+        
+        payload = _token_cache.get(token)
+        if payload is not None:
+            # Expiry and revocation are still enforced on every hit, not only on decode;
+            # the revocation check includes Redis, so a token revoked on another worker is refused here too
+            if payload.get("exp", 0) > current_time and not self.is_token_revoked(payload):
+                return payload
+            _token_cache.pop(token)
+            return None
+        
         try:
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
-            return payload
-        except JWTError:
+            payload = jwt.decode(
+                token,
+                self.jwt_secret,
+                algorithms=[self.jwt_algorithm],
+                options={"require": ["exp"]}
+            )
+        except PyJWTError:
+            return None
+        
+        if self.is_token_revoked(payload):
             return None
+        
+        _token_cache.set(token, payload)
+        return payload
     
     def refresh_token(self, token: str) -> Optional[str]:
-        """Refresh a JWT token if it's still valid."""
+        """Rotate a still-valid JWT token: issue a new one and revoke the old one."""
         payload = self.verify_token(token)
         if payload and payload.get("exp", 0) > datetime.utcnow().timestamp():
             # Create new token with same data but new expiry
             new_token = self.create_access_token(
                 {"sub": payload.get("sub"), "user_id": payload.get("user_id")}
             )
+            self.revoke_token(token, payload)
             return new_token
         return None
     
+    def revoke_token(self, token: str, payload: Dict[str, Any]):
+        """Revoke a token until its original expiry."""
+        _token_cache.pop(token)
+        
+        jti = payload.get("jti")
+        if not jti:
+            return
+        
+        exp = payload.get("exp", 0)
+        current_time = time.time()
+        with _revoked_token_lock:
+            # Drop entries whose tokens would be rejected as expired anyway
+            while _revoked_token_expiries and _revoked_token_expiries[0][0] <= current_time:
+                stale_exp, stale_jti = heapq.heappop(_revoked_token_expiries)
+                if _revoked_token_ids.get(stale_jti) == stale_exp:
+                    del _revoked_token_ids[stale_jti]
+            _revoked_token_ids[jti] = exp
+            heapq.heappush(_revoked_token_expiries, (exp, jti))
+        
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{REDIS_KEY_PREFIX}revoked:{jti}", 1, ex=max(int(exp - current_time), 1))
+            except Exception as e:
+                logger.warning(f"Failed to record revoked token in Redis: {e}")
+    
+    def is_token_revoked(self, payload: Dict[str, Any]) -> bool:
+        """Check if a token has been retired by refresh rotation."""
+        jti = payload.get("jti")
+        if not jti:
+            return False
+        if jti in _revoked_token_ids:
+            return True
+        
+        if self.redis is not None:
+            try:
+                return bool(self.redis.exists(f"{REDIS_KEY_PREFIX}revoked:{jti}"))
+            except Exception as e:
+                logger.warning(f"Redis revoked-token check failed, using in-memory map: {e}")
+        
+        return False
+    
     # Rate Limiting
     def check_rate_limit(self, client_ip: str, endpoint: str) -> bool:
         """Check if client has exceeded rate limit."""
-        key = f"{client_ip}:{endpoint}"
-        current_time = time.time()
+        if self.redis is not None:
+            try:
+                count = self._rate_limit_script(
+                    keys=[
+                        f"{REDIS_KEY_PREFIX}rate:{client_ip}:{endpoint}",
+                        f"{REDIS_KEY_PREFIX}ip:{client_ip}",
+                        f"{REDIS_KEY_PREFIX}active_rate_limits"
+                    ],
+                    args=[RATE_LIMIT_WINDOW, SUSPICIOUS_IP_WINDOW, int(time.time())]
+                )
+                return count <= RATE_LIMIT_REQUESTS
+            except Exception as e:
+                logger.warning(f"Redis rate limit check failed, using in-memory tracker: {e}")
         
-        if key not in _rate_limit_tracker:
-            _rate_limit_tracker[key] = []
+        key = (client_ip, endpoint)
+        # Window starts are monotonic clock readings, not wall-clock timestamps
+        current_time = time.monotonic()
+        _sweep_request_trackers(current_time)
         
-        # Clean old entries
-        _rate_limit_tracker[key] = [
-            timestamp for timestamp in _rate_limit_tracker[key]
-            if current_time - timestamp < RATE_LIMIT_WINDOW
-        ]
+        # Per-IP one-minute counter backing is_suspicious_ip
+        ip_window = _ip_request_tracker.get(client_ip)
+        if ip_window is None or current_time - ip_window["window_start"] >= SUSPICIOUS_IP_WINDOW:
+            ip_window = _ip_request_tracker[client_ip] = {"count": 0, "window_start": current_time}
+        ip_window["count"] += 1
+        
+        # Fixed-window counter per client and endpoint
+        window = _rate_limit_tracker.get(key)
+        if window is None or current_time - window["window_start"] >= RATE_LIMIT_WINDOW:
+            window = _rate_limit_tracker[key] = {"count": 0, "window_start": current_time}
         
         # Check if limit exceeded
-        if len(_rate_limit_tracker[key]) >= RATE_LIMIT_REQUESTS:
+        if window["count"] >= RATE_LIMIT_REQUESTS:
             return False
         
-        # Add current request
-        _rate_limit_tracker[key].append(current_time)
+        # Count current request
+        window["count"] += 1
         return True
     
     # Login Security
     def record_login_attempt(self, client_ip: str, username: str, success: bool):
         """Record login attempt for security tracking."""
-        key = f"{client_ip}:{username}"
+        if self.redis is not None:
+            try:
+                self._record_login_attempt_redis(client_ip, username, success)
+                return
+            except Exception as e:
+                logger.warning(f"Redis login tracking failed, using in-memory tracker: {e}")
+        
+        key = (client_ip, username)
         current_time = datetime.utcnow()
         
         if key not in _login_attempts:
@@ -199,9 +386,47 @@ class SecurityManager:
                     client_ip
                 )
     
+    def _record_login_attempt_redis(self, client_ip: str, username: str, success: bool):
+        """Record a login attempt in Redis; the lockout expires on its own."""
+        attempts_key = f"{REDIS_KEY_PREFIX}login:{client_ip}:{username}"
+        lock_key = f"{REDIS_KEY_PREFIX}locked:{client_ip}:{username}"
+        
+        locked_set = f"{REDIS_KEY_PREFIX}locked_accounts"
+        
+        if success:
+            pipe = self.redis.pipeline()
+            pipe.delete(attempts_key, lock_key)
+            pipe.zrem(locked_set, lock_key)
+            pipe.execute()
+            return
+        
+        pipe = self.redis.pipeline()
+        pipe.incr(attempts_key)
+        pipe.expire(attempts_key, LOCKOUT_DURATION_MINUTES * 60)
+        attempts, _ = pipe.execute()
+        
+        if attempts >= MAX_LOGIN_ATTEMPTS:
+            pipe = self.redis.pipeline()
+            pipe.set(lock_key, attempts, ex=LOCKOUT_DURATION_MINUTES * 60)
+            # Scored by when the lock expires, so reports count live locks with ZCARD
+            pipe.zadd(locked_set, {lock_key: time.time() + LOCKOUT_DURATION_MINUTES * 60})
+            pipe.delete(attempts_key)
+            pipe.execute()
+            self._log_suspicious_activity(
+                "account_locked",
+                f"Account locked due to {attempts} failed login attempts",
+                client_ip
+            )
+    
     def is_account_locked(self, client_ip: str, username: str) -> bool:
         """Check if account is locked due to failed attempts."""
-        key = f"{client_ip}:{username}"
+        if self.redis is not None:
+            try:
+                return bool(self.redis.exists(f"{REDIS_KEY_PREFIX}locked:{client_ip}:{username}"))
+            except Exception as e:
+                logger.warning(f"Redis lockout check failed, using in-memory tracker: {e}")
+        
+        key = (client_ip, username)
         
         if key not in _login_attempts:
             return False
@@ -221,26 +446,48 @@ class SecurityManager:
     # IP Security
     def is_ip_blocked(self, client_ip: str) -> bool:
         """Check if IP is blocked."""
+        if self.redis is not None:
+            try:
+                return bool(self.redis.sismember(f"{REDIS_KEY_PREFIX}blocked_ips", client_ip))
+            except Exception as e:
+                logger.warning(f"Redis blocked-IP check failed, using in-memory set: {e}")
+        
         return client_ip in _blocked_ips
     
     def block_ip(self, client_ip: str, reason: str):
         """Block an IP address."""
         _blocked_ips.add(client_ip)
+        if self.redis is not None:
+            try:
+                self.redis.sadd(f"{REDIS_KEY_PREFIX}blocked_ips", client_ip)
+            except Exception as e:
+                logger.warning(f"Failed to record blocked IP in Redis: {e}")
         self._log_suspicious_activity("ip_blocked", reason, client_ip)
     
     def unblock_ip(self, client_ip: str):
         """Unblock an IP address."""
         _blocked_ips.discard(client_ip)
+        if self.redis is not None:
+            try:
+                self.redis.srem(f"{REDIS_KEY_PREFIX}blocked_ips", client_ip)
+            except Exception as e:
+                logger.warning(f"Failed to remove blocked IP from Redis: {e}")
     
     def is_suspicious_ip(self, client_ip: str) -> bool:
         """Check if IP exhibits suspicious behavior."""
+        if self.redis is not None:
+            try:
+                count = self.redis.get(f"{REDIS_KEY_PREFIX}ip:{client_ip}")
+                return int(count or 0) > SUSPICIOUS_IP_REQUESTS
+            except Exception as e:
+                logger.warning(f"Redis suspicious-IP check failed, using in-memory tracker: {e}")
+        
         # Check for rapid requests from same IP
-        recent_requests = [
-            timestamp for timestamp in _rate_limit_tracker.get(client_ip, [])
-            if time.time() - timestamp < 60  # Last minute
-        ]
+        window = _ip_request_tracker.get(client_ip)
+        if window is None or time.monotonic() - window["window_start"] >= SUSPICIOUS_IP_WINDOW:
+            return False
         
-        return len(recent_requests) > 50  # More than 50 requests per minute
+        return window["count"] > SUSPICIOUS_IP_REQUESTS
     
     # Input Validation
     def sanitize_input(self, input_string: str) -> str:
@@ -249,7 +496,7 @@ class SecurityManager:
             return ""
         
         # Remove potentially dangerous characters
-        sanitized = re.sub(r'[<>"\']', '', input_string)
+        sanitized = _UNSAFE_INPUT_RE.sub('', input_string)
         
         # Limit length
         if len(sanitized) > 1000:
@@ -258,22 +505,22 @@ class SecurityManager:
         return sanitized.strip()
     
     def validate_audio_data(self, audio_data: str) -> bool:
-        """Validate audio data format and size."""
+        """Validate audio data format and size without decoding the whole payload."""
         try:
-            import base64
-            # Decode base64
-            decoded = base64.b64decode(audio_data)
-            
-            # Check size (max 50MB)
-            if len(decoded) > 50 * 1024 * 1024:
+            # Line-wrapped base64 is accepted like b64decode does; whitespace is counted, not copied out
+            encoded_length = len(audio_data) - sum(audio_data.count(c) for c in _BASE64_WHITESPACE)
+            if encoded_length % 4:
                 return False
             
-            # Check if it's valid audio format (basic check)
-            if decoded[:4] in [b'RIFF', b'ID3 ', b'\xff\xfb', b'\xff\xf3']:
-                return True
+            # Check size (max 50MB) from the base64 length alone
+            decoded_size = (encoded_length * 3) // 4 - audio_data.rstrip()[-2:].count('=')
+            if decoded_size > MAX_AUDIO_BYTES:
+                return False
             
-            return False
-        except Exception:
+            # Decode only the leading bytes for a magic-number check
+            header = base64.b64decode("".join(audio_data[:256].split())[:12], validate=True)
+            return header.startswith(AUDIO_MAGIC_NUMBERS)
+        except (binascii.Error, ValueError):
             return False
     
     # Security Logging
@@ -281,39 +528,71 @@ class SecurityManager:
         """Log suspicious activity."""
         activity = {
             "timestamp": datetime.utcnow().isoformat(),
+            "logged_at": time.time(),  # Epoch seconds for cheap age checks
             "type": activity_type,
             "description": description,
             "client_ip": client_ip
         }
         _suspicious_activities.append(activity)
-        
-        # Keep only last 1000 activities
-        if len(_suspicious_activities) > 1000:
-            _suspicious_activities.pop(0)
     
     def get_security_report(self) -> Dict[str, Any]:
         """Get security report."""
         current_time = datetime.utcnow()
+        current_ts = time.time()
         
-        # Count recent suspicious activities
-        recent_activities = [
-            activity for activity in _suspicious_activities
-            if (current_time - datetime.fromisoformat(activity["timestamp"])).total_seconds() < 3600
-        ]
+        # Count recent suspicious activities, keeping only the last 10 as we go
+        recent_count = 0
+        recent_activities = deque(maxlen=10)
+        for activity in _suspicious_activities:
+            if current_ts - activity["logged_at"] < 3600:
+                recent_count += 1
+                recent_activities.append(activity)
         
-        return {
+        locked_accounts = 0
+        for data in _login_attempts.values():
+            locked_until = data.get("locked_until")
+            if locked_until and current_time < locked_until:
+                locked_accounts += 1
+        
+        report = {
             "blocked_ips": len(_blocked_ips),
-            "recent_suspicious_activities": len(recent_activities),
+            "recent_suspicious_activities": recent_count,
             "active_rate_limits": len(_rate_limit_tracker),
-            "locked_accounts": len([
-                key for key, data in _login_attempts.items()
-                if data.get("locked_until") and current_time < data["locked_until"]
-            ]),
-            "recent_activities": recent_activities[-10:]  # Last 10 activities
+            "locked_accounts": locked_accounts,
+            "recent_activities": list(recent_activities)  # Last 10 activities
+        }
+        
+        if self.redis is not None:
+            try:
+                report.update(self._get_redis_counts())
+            except Exception as e:
+                logger.warning(f"Failed to read security counts from Redis: {e}")
+        
+        return report
+    
+    def _get_redis_counts(self) -> Dict[str, int]:
+        """Count the shared security state kept in Redis, from its set sizes rather than a keyspace scan."""
+        rate_limits = f"{REDIS_KEY_PREFIX}active_rate_limits"
+        locked_accounts = f"{REDIS_KEY_PREFIX}locked_accounts"
+        now = time.time()
+        
+        pipe = self.redis.pipeline()
+        pipe.scard(f"{REDIS_KEY_PREFIX}blocked_ips")
+        # Drop members whose keys have expired, then count what is left
+        pipe.zremrangebyscore(rate_limits, "-inf", now)
+        pipe.zcard(rate_limits)
+        pipe.zremrangebyscore(locked_accounts, "-inf", now)
+        pipe.zcard(locked_accounts)
+        blocked_ips, _, active_rate_limits, _, locked = pipe.execute()
+        
+        return {
+            "blocked_ips": blocked_ips,
+            "active_rate_limits": active_rate_limits,
+            "locked_accounts": locked
         }
 
 # Global security manager instance
-security_manager = SecurityManager()
+security_manager = SecurityManager(_create_redis_client())
 
 # FastAPI Security Dependencies
 security_scheme = HTTPBearer()
@@ -332,6 +611,16 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     
     return payload
 
+def validate_audio_request(request: AudioRequest) -> AudioRequest:
+    """FastAPI dependency that rejects requests carrying malformed audio data."""
+    if request.audio_data and not security_manager.validate_audio_data(request.audio_data):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid audio data format"
+        )
+    
+    return request
+
 def require_authentication(func):
     """Decorator to require authentication."""
     @wraps(func)
@@ -8,7 +8,7 @@ import os
 load_dotenv('config.env')
 
 from .api import audio, mood, monitoring, analytics, auth
-from .middleware.security_middleware import SecurityMiddleware, AuthenticationMiddleware, InputValidationMiddleware
+from .middleware.security_middleware import SecurityMiddleware
 from .core.security import security_manager
 
 app = FastAPI(
@@ -26,10 +26,8 @@ origins = [
     "http://192.168.29.185:8080"
 ]
 
-# Add security middleware
-app.add_middleware(SecurityMiddleware)
-app.add_middleware(InputValidationMiddleware)
-app.add_middleware(AuthenticationMiddleware, protected_paths=["/api/v1/mood"])
+# Add security middleware (IP filtering, rate limiting, input size, auth, headers)
+app.add_middleware(SecurityMiddleware, protected_paths=["/api/v1/mood"])
 
 # Add trusted host middleware
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -90,10 +88,24 @@ async def startup_event():
         monitoring_service.start_monitoring()
         print("📊 Monitoring service started")
         
+        # Keep the daily analytics snapshot current
+        from .services.database_service import daily_stats_refresher
+        daily_stats_refresher.start()
+        
     except Exception as e:
         print(f"❌ Error during model initialization: {e}")
         print("⚠️  Application will start with limited functionality.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Write out system metrics still waiting in the batch queue
+    from .services.database_service import metrics_writer, daily_stats_refresher
+    metrics_writer.stop()
+    daily_stats_refresher.stop()
+    # Stop the emotion micro-batching worker; requests still queued get the fallback result
+    from .services.emotion_detector import emotion_detector
+    await emotion_detector.stop_batching()
+
 @app.get("/health")
 def health_check():
     """Health check endpoint with model status."""
@@ -2,69 +2,118 @@
 Security middleware for Voice CBT application.
 """
 
+import re
 import time
-import json
-from typing import Callable
-from fastapi import Request, Response, HTTPException, status
+import orjson
+from typing import Optional
+from fastapi import Request, Response, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
 
 from ..core.security import security_manager
 
 logger = logging.getLogger(__name__)
 
-class SecurityMiddleware(BaseHTTPMiddleware):
-    """Security middleware for request filtering and monitoring."""
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson."""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+# Injection / XSS signatures, fused into one pattern so each input is scanned once
+_SUSPICIOUS_PATTERNS = [
+    r"union\s+select", r"drop\s+table", r"delete\s+from",
+    r"insert\s+into", r"update\s+set", r"exec\s*\(",
+    r"script\s*>", r"<script", r"javascript:",
+    r"onload\s*=", r"onerror\s*=", r"onclick\s*="
+]
+_SUSPICIOUS_RE = re.compile("|".join(f"(?:{p})" for p in _SUSPICIOUS_PATTERNS), re.IGNORECASE)
+
+# Paths additionally flag traversal and server-side script extensions, all in the same single pass
+_SUSPICIOUS_EXTENSIONS = [".php", ".asp", ".jsp", ".cgi", ".pl"]
+_SUSPICIOUS_PATH_RE = re.compile(
+    "|".join([f"(?:{p})" for p in _SUSPICIOUS_PATTERNS] + [re.escape("..")] + [re.escape(ext) for ext in _SUSPICIOUS_EXTENSIONS]),
+    re.IGNORECASE
+)
+
+def get_client_ip(request: Request) -> str:
+    """Get client IP address."""
+    # Check for forwarded headers first
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if forwarded_for:
+        return forwarded_for.partition(",")[0].strip()
+    
+    real_ip = request.headers.get("X-Real-IP")
+    if real_ip:
+        return real_ip
+    
+    # Fallback to direct connection
+    return request.client.host if request.client else "unknown"
+
+MAX_REQUEST_SIZE = 10 * 1024 * 1024  # 10MB limit
+
+# Security headers added to every HTTP response
+_SECURITY_HEADERS = {
+    # Content Security Policy - Allow Swagger UI resources
+    "Content-Security-Policy": (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+        "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+        "img-src 'self' data: https:; "
+        "connect-src 'self'; "
+        "frame-ancestors 'none';"
+    ),
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
+}
+# Pre-encoded once so responses only need a list extend
+_SECURITY_HEADERS_RAW = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in _SECURITY_HEADERS.items()]
+
+class SecurityMiddleware:
+    """
+    Pure ASGI security middleware.
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
+    Performs IP blocking, rate limiting, suspicious-request detection,
+    request-size validation and authentication of protected paths in a
+    single pass, then adds security headers and logs the response.
+    """
+    
+    def __init__(self, app: ASGIApp, protected_paths: list = None):
+        self.app = app
+        self.protected_paths = protected_paths or ["/api/v1/session", "/api/v1/mood"]
+        self._protected_prefixes = tuple(self.protected_paths)
         self.security_manager = security_manager
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Process request through security checks."""
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         start_time = time.time()
-        client_ip = self._get_client_ip(request)
+        request = Request(scope)
+        client_ip = request.state.client_ip = get_client_ip(request)
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        response_started = False
+        
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), *_SECURITY_HEADERS_RAW]
+            await send(message)
         
         try:
-            # Check if IP is blocked
-            if self.security_manager.is_ip_blocked(client_ip):
-                logger.warning(f"Blocked IP attempted access: {client_ip}")
-                return JSONResponse(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    content={"detail": "Access denied"}
-                )
-            
-            # Check rate limiting
-            endpoint = f"{request.method}:{request.url.path}"
-            if not self.security_manager.check_rate_limit(client_ip, endpoint):
-                logger.warning(f"Rate limit exceeded for IP {client_ip} on {endpoint}")
-                return JSONResponse(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    content={"detail": "Rate limit exceeded"}
-                )
-            
-            # Check for suspicious patterns
-            if self._is_suspicious_request(request):
-                logger.warning(f"Suspicious request from {client_ip}: {request.url}")
-                self.security_manager._log_suspicious_activity(
-                    "suspicious_request",
-                    f"Suspicious request pattern: {request.method} {request.url.path}",
-                    client_ip
-                )
-            
-            # Process request
-            response = await call_next(request)
-            
-            # Add security headers
-            response = self._add_security_headers(response)
-            
-            # Log request
-            self._log_request(request, response, client_ip, time.time() - start_time)
-            
-            return response
-            
+            rejection = self._check_request(request, client_ip)
+            if rejection is not None:
+                await rejection(scope, receive, send_with_headers)
+            else:
+                await self.app(scope, receive, send_with_headers)
         except Exception as e:
             logger.error(f"Security middleware error: {e}")
             self.security_manager._log_suspicious_activity(
@@ -72,125 +121,69 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 f"Security middleware error: {str(e)}",
                 client_ip
             )
-            return JSONResponse(
+            if response_started:
+                raise
+            await ORJSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={"detail": "Internal server error"}
-            )
+            )(scope, receive, send_with_headers)
+        finally:
+            self._log_request(request, status_code, client_ip, time.time() - start_time)
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Get client IP address."""
-        # Check for forwarded headers first
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-        
-        # Fallback to direct connection
-        return request.client.host if request.client else "unknown"
-    
-    def _is_suspicious_request(self, request: Request) -> bool:
-        """Check if request exhibits suspicious patterns."""
-        # Check for SQL injection patterns
-        sql_patterns = [
-            r"union\s+select", r"drop\s+table", r"delete\s+from",
-            r"insert\s+into", r"update\s+set", r"exec\s*\(",
-            r"script\s*>", r"<script", r"javascript:",
-            r"onload\s*=", r"onerror\s*=", r"onclick\s*="
-        ]
-        
-        # Check URL path
-        for pattern in sql_patterns:
-            if re.search(pattern, request.url.path, re.IGNORECASE):
-                return True
-        
-        # Check query parameters
-        for param_name, param_value in request.query_params.items():
-            for pattern in sql_patterns:
-                if re.search(pattern, param_value, re.IGNORECASE):
-                    return True
+    def _check_request(self, request: Request, client_ip: str) -> Optional[Response]:
+        """Run the request-level checks; return a response if the request is rejected."""
+        # Check if IP is blocked
+        if self.security_manager.is_ip_blocked(client_ip):
+            logger.warning(f"Blocked IP attempted access: {client_ip}")
+            return ORJSONResponse(
+                status_code=status.HTTP_403_FORBIDDEN,
+                content={"detail": "Access denied"}
+            )
         
-        # Check for excessive path traversal
-        if ".." in request.url.path:
-            return True
+        # Check rate limiting
+        endpoint = f"{request.method}:{request.url.path}"
+        if not self.security_manager.check_rate_limit(client_ip, endpoint):
+            logger.warning(f"Rate limit exceeded for IP {client_ip} on {endpoint}")
+            return ORJSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={"detail": "Rate limit exceeded"}
+            )
         
-        # Check for suspicious file extensions
-        suspicious_extensions = [".php", ".asp", ".jsp", ".cgi", ".pl"]
-        for ext in suspicious_extensions:
-            if ext in request.url.path.lower():
-                return True
+        # Check for suspicious patterns
+        if self._is_suspicious_request(request):
+            logger.warning(f"Suspicious request from {client_ip}: {request.url}")
+            self.security_manager._log_suspicious_activity(
+                "suspicious_request",
+                f"Suspicious request pattern: {request.method} {request.url.path}",
+                client_ip
+            )
         
-        return False
-    
-    def _add_security_headers(self, response: Response) -> Response:
-        """Add security headers to response."""
-        # Content Security Policy - Allow Swagger UI resources
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-            "img-src 'self' data: https:; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
-        )
-        
-        # Other security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-        
-        return response
-    
-    def _log_request(self, request: Request, response: Response, client_ip: str, duration: float):
-        """Log request details."""
-        log_data = {
-            "timestamp": time.time(),
-            "client_ip": client_ip,
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
-            "duration_ms": round(duration * 1000, 2),
-            "user_agent": request.headers.get("User-Agent", ""),
-            "referer": request.headers.get("Referer", "")
-        }
+        # Validate request size (audio payloads are validated by the endpoint's dependency)
+        content_length = request.headers.get("Content-Length")
+        if content_length and int(content_length) > MAX_REQUEST_SIZE:
+            return ORJSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": "Request too large"}
+            )
         
-        # Log based on status code
-        if response.status_code >= 500:
-            logger.error(f"Server error: {json.dumps(log_data)}")
-        elif response.status_code >= 400:
-            logger.warning(f"Client error: {json.dumps(log_data)}")
-        else:
-            logger.info(f"Request: {json.dumps(log_data)}")
-
-class AuthenticationMiddleware(BaseHTTPMiddleware):
-    """Authentication middleware for protected endpoints."""
-    
-    def __init__(self, app: ASGIApp, protected_paths: list = None):
-        super().__init__(app)
-        self.protected_paths = protected_paths or ["/api/v1/session", "/api/v1/mood"]
-        self.security_manager = security_manager
+        return self._authenticate(request)
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def _authenticate(self, request: Request) -> Optional[Response]:
         """Check authentication for protected paths."""
         # Skip authentication for non-protected paths
-        if not any(request.url.path.startswith(path) for path in self.protected_paths):
-            return await call_next(request)
+        if not request.url.path.startswith(self._protected_prefixes):
+            return None
         
         # Skip authentication in test mode
         if request.headers.get("X-Test-Mode") == "true":
             # Add mock user info for tests
             request.state.user = {"user_id": "test_user", "role": "user"}
-            return await call_next(request)
+            return None
         
         # Check for authorization header
         auth_header = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 content={"detail": "Authentication required"}
             )
@@ -200,50 +193,46 @@ class AuthenticationMiddleware(BaseHTTPMiddleware):
         payload = self.security_manager.verify_token(token)
         
         if not payload:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 content={"detail": "Invalid token"}
             )
         
         # Add user info to request state
         request.state.user = payload
-        
-        return await call_next(request)
-
-class InputValidationMiddleware(BaseHTTPMiddleware):
-    """Input validation middleware."""
+        return None
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.security_manager = security_manager
+    def _is_suspicious_request(self, request: Request) -> bool:
+        """Check if request exhibits suspicious patterns."""
+        # Check URL path for SQL injection / XSS patterns, path traversal and suspicious extensions
+        if _SUSPICIOUS_PATH_RE.search(request.url.path):
+            return True
+        
+        # Check query parameters
+        return any(_SUSPICIOUS_RE.search(param_value) for param_value in request.query_params.values())
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Validate input data."""
-        # Validate request size
-        content_length = request.headers.get("Content-Length")
-        if content_length and int(content_length) > 10 * 1024 * 1024:  # 10MB limit
-            return JSONResponse(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                content={"detail": "Request too large"}
-            )
+    def _log_request(self, request: Request, status_code: int, client_ip: str, duration: float):
+        """Log request details."""
+        # Pick the level from the status code and bail out before building anything
+        if status_code >= 500:
+            level, label = logging.ERROR, "Server error"
+        elif status_code >= 400:
+            level, label = logging.WARNING, "Client error"
+        else:
+            level, label = logging.INFO, "Request"
         
-        # Validate audio data for audio endpoints
-        if request.url.path.startswith("/api/v1/session/start"):
-            try:
-                body = await request.body()
-                if body:
-                    data = json.loads(body)
-                    audio_data = data.get("audio_data", "")
-                    
-                    if audio_data and not self.security_manager.validate_audio_data(audio_data):
-                        return JSONResponse(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            content={"detail": "Invalid audio data format"}
-                        )
-            except (json.JSONDecodeError, KeyError):
-                pass  # Let the endpoint handle validation errors
-        
-        return await call_next(request)
-
-# Import regex for pattern matching
-import re
+        if not logger.isEnabledFor(level):
+            return
+        
+        log_data = {
+            "timestamp": time.time(),
+            "client_ip": client_ip,
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "user_agent": request.headers.get("User-Agent", ""),
+            "referer": request.headers.get("Referer", "")
+        }
+        
+        logger.log(level, "%s: %s", label, orjson.dumps(log_data).decode())
@@ -2,35 +2,164 @@
 Database models and connection management for Voice CBT application.
 """
 
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, Text, Boolean, JSON
+from sqlalchemy import event, inspect, text, create_engine, Column, String, Integer, Float, Date, DateTime, Text, Boolean, JSON, Index, and_, func, case, insert, delete, select, lambda_stmt
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.orm import sessionmaker, Session, relationship, make_transient_to_detached, object_session
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Any, Iterator, Tuple, Callable
+import hashlib
 import os
+import time
 import uuid
+import orjson
+
+from ..core.cache import TTLCache
 
 # Database configuration - supports both SQLite and PostgreSQL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./voice_cbt.db")
 
+def _uuid7() -> uuid.UUID:
+    """Time-ordered UUIDv7 (RFC 9562): 48-bit millisecond timestamp followed by random bits."""
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    # Overwrite the version nibble (7) and the variant bits (0b10)
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+# Primary keys are time-ordered so new rows land at the tail of the index instead of on random pages
+uuid7 = getattr(uuid, "uuid7", _uuid7)
+
 # SQLite doesn't support UUID, so we'll use String for IDs
 if DATABASE_URL.startswith("sqlite"):
     # Use String for SQLite compatibility
     ID_TYPE = String(36)
     def UUID_DEFAULT():
-        return str(uuid.uuid4())
+        return str(uuid7())
+    # INSERT ... ON CONFLICT is dialect-specific
+    from sqlalchemy.dialects.sqlite import insert as dialect_insert
 else:
     # Use UUID for PostgreSQL
-    from sqlalchemy.dialects.postgresql import UUID
+    from sqlalchemy.dialects.postgresql import UUID, insert as dialect_insert
     ID_TYPE = UUID(as_uuid=True)
-    UUID_DEFAULT = uuid.uuid4
+    UUID_DEFAULT = uuid7
+
+# Append-only time series are range-partitioned by month on Postgres so tail queries prune old partitions
+PARTITION_TABLES = not DATABASE_URL.startswith("sqlite")
+_MONTHLY_PARTITIONS = {"postgresql_partition_by": "RANGE (timestamp)"} if PARTITION_TABLES else {}
+
+class utc_now(FunctionElement):
+    """Server-side insert time at sub-second resolution.
+    
+    Postgres now() is frozen at transaction start and SQLite's CURRENT_TIMESTAMP only has
+    whole seconds, so rows written together would share a timestamp.
+    """
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(utc_now)
+def _compile_utc_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+@compiles(utc_now, "postgresql")
+def _compile_utc_now_postgresql(element, compiler, **kw):
+    return "clock_timestamp()"
+
+@compiles(utc_now, "sqlite")
+def _compile_utc_now_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Create engine; a larger compiled-statement cache keeps the hot queries from being recompiled
+_engine_options = {
+    "echo": False,
+    "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+}
+if not DATABASE_URL.startswith("sqlite"):
+    # LIFO reuse keeps a few warm connections (and their server-side caches) busy while idle ones age out
+    _engine_options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "30")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+        # Server-filled timestamps are stored without a zone, so pin the session clock to UTC
+        connect_args={"options": "-c timezone=utc"}
+    )
+
+# Resolve the DBAPI from the dialect, since a bare postgresql:// URL may map to either psycopg version
+_driver = make_url(DATABASE_URL).get_dialect().driver
+if _driver == "psycopg2":
+    # Let psycopg2 send executemany() as multi-row VALUES pages instead of one round-trip per row
+    _engine_options["executemany_mode"] = "values_plus_batch"
+    _engine_options["insertmanyvalues_page_size"] = int(os.getenv("DB_INSERT_PAGE_SIZE", "1000"))
+elif _driver == "psycopg":
+    # psycopg 3 prepares statements server-side, so Postgres parses and plans each one once per connection
+    _engine_options["connect_args"]["prepare_threshold"] = int(os.getenv("DB_PREPARE_THRESHOLD", "0"))
+
+def _json_serializer(value: Any) -> str:
+    """Serialize JSON columns with orjson, passing NumPy arrays through without a list copy."""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
 
-# Create engine
-engine = create_engine(DATABASE_URL, echo=False)
+# JSON columns (preferences, emotion_features, triggers) go through orjson instead of stdlib json
+_engine_options["json_serializer"] = _json_serializer
+_engine_options["json_deserializer"] = orjson.loads
+
+engine = create_engine(DATABASE_URL, **_engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def after_commit(db: Session, callback: Callable[[], Any]):
+    """Run callback once the session's flushed writes are committed, or right away if it has none.
+    
+    Cache fills and invalidations go through here, so no other request can observe (or re-cache)
+    state from a transaction that is still open or is later rolled back.
+    """
+    if db.info.get("uncommitted_writes"):
+        db.info.setdefault("after_commit", []).append(callback)
+    else:
+        callback()
+
+@event.listens_for(SessionLocal, "before_flush")
+def _mark_uncommitted_writes(session, flush_context, instances):
+    # Set before the rows are written, so mapper events fired during the flush already defer
+    session.info["uncommitted_writes"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _run_after_commit_callbacks(session):
+    session.info.pop("uncommitted_writes", None)
+    for callback in session.info.pop("after_commit", ()):
+        callback()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_after_commit_callbacks(session):
+    session.info.pop("uncommitted_writes", None)
+    session.info.pop("after_commit", None)
+
 Base = declarative_base()
 
+_AUDIO_HASH_CHUNK = 64 * 1024
+
+def hash_audio(audio_bytes: bytes) -> str:
+    """SHA-256 hex digest of an audio payload, for Interaction.audio_data_hash."""
+    # OpenSSL's sha256 uses the CPU's SHA extensions; memoryview slices feed it without copying
+    digest = hashlib.sha256()
+    view = memoryview(audio_bytes)
+    for start in range(0, len(view), _AUDIO_HASH_CHUNK):
+        digest.update(view[start:start + _AUDIO_HASH_CHUNK])
+    return digest.hexdigest()
+
+def hash_base64_audio(base64_audio: str) -> str:
+    """SHA-256 hex digest of a base64 audio payload's text, so an upload is hashed without decoding it."""
+    digest = hashlib.sha256()
+    for start in range(0, len(base64_audio), _AUDIO_HASH_CHUNK):
+        # Whitespace and line breaks don't change the decoded audio, so they don't change the hash
+        digest.update(base64_audio[start:start + _AUDIO_HASH_CHUNK].encode("ascii").translate(None, b" \t\r\n"))
+    return digest.hexdigest()
+
 class User(Base):
     """User model for storing user information."""
     __tablename__ = "users"
@@ -38,30 +167,100 @@ class User(Base):
     id = Column(ID_TYPE, primary_key=True, default=UUID_DEFAULT)
     username = Column(String(50), unique=True, nullable=False)
     email = Column(String(100), unique=True, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utc_now())
     is_active = Column(Boolean, default=True)
     preferences = Column(JSON, default={})
 
-class Session(Base):
+# Per-process cache of user rows keyed by ("id", user_id) or ("username", username)
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+_user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+_USER_COLUMNS = tuple(column.key for column in User.__table__.columns)
+
+def _cache_user(db: Session, user: User):
+    """Remember a loaded user's column values under both of its lookup keys, once they are committed."""
+    values = {key: getattr(user, key) for key in _USER_COLUMNS}
+    
+    def store():
+        for key in (("id", str(values["id"])), ("username", values["username"])):
+            _user_cache.set(key, values)
+    
+    # A row read back inside an open unit of work may still be rolled back
+    after_commit(db, store)
+
+def _get_cached_user(db: Session, key: tuple) -> Optional[User]:
+    """Attach a cached user to the session without a SELECT, or None on a miss."""
+    # The cache hands out a copy, so in-place edits to preferences never reach it
+    values = _user_cache.get(key)
+    if values is None:
+        return None
+    
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_cached_user(mapper, connection, target: User):
+    """Drop a user's cache entries whenever the row is written, including a renamed username."""
+    keys = [("id", str(target.id))]
+    keys.extend(("username", username) for username in {target.username, *inspect(target).attrs.username.history.deleted})
+    
+    def evict():
+        for key in keys:
+            _user_cache.pop(key)
+    
+    # Now, and again at commit, in case another session cached the old row in between
+    evict()
+    session = object_session(target)
+    if session is not None:
+        after_commit(session, evict)
+
+class TherapySession(Base):
     """Therapy session model."""
     __tablename__ = "sessions"
+    # B-tree indexes are scanned backwards for the DESC orderings, so plain column order is enough
+    __table_args__ = (
+        Index("ix_sessions_user_started", "user_id", "started_at"),
+        # Analytics windows filter on started_at alone and read status and duration
+        Index("ix_sessions_started", "started_at", postgresql_include=["status", "duration_minutes"]),
+    )
     
     id = Column(ID_TYPE, primary_key=True, default=UUID_DEFAULT)
     user_id = Column(ID_TYPE, nullable=False)
-    started_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, server_default=utc_now())
     ended_at = Column(DateTime, nullable=True)
     duration_minutes = Column(Integer, nullable=True)
     session_type = Column(String(50), default="voice_cbt")
     status = Column(String(20), default="active")  # active, completed, abandoned
+    
+    # No FK constraint on the columns, so the join is spelled out; lazy loads raise to surface N+1 access
+    interactions = relationship(
+        "Interaction",
+        primaryjoin="TherapySession.id == foreign(Interaction.session_id)",
+        back_populates="session",
+        lazy="raise"
+    )
 
 class Interaction(Base):
     """Individual interaction within a session."""
     __tablename__ = "interactions"
+    __table_args__ = (
+        Index("ix_interactions_session_ts", "session_id", "timestamp"),
+        # Lets a repeated upload find the analysis already stored for the same audio
+        Index("ix_interaction_user_audio", "user_id", "audio_data_hash"),
+        # Per-user and system-wide analytics windows, the latter grouped by emotion or hour
+        Index("ix_interaction_user_time", "user_id", "timestamp"),
+        Index("ix_interaction_time_emotion", "timestamp", "detected_emotion", postgresql_include=["emotion_confidence"]),
+        _MONTHLY_PARTITIONS,
+    )
     
     id = Column(ID_TYPE, primary_key=True, default=UUID_DEFAULT)
     session_id = Column(ID_TYPE, nullable=False)
     user_id = Column(ID_TYPE, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    # A partitioned table's primary key has to include the partition column
+    timestamp = Column(DateTime, server_default=utc_now(), primary_key=PARTITION_TABLES)
     
     # Audio and transcription data
     audio_data_hash = Column(String(64), nullable=True)  # Hash of audio for deduplication
@@ -80,14 +279,26 @@ class Interaction(Base):
     processing_time_ms = Column(Integer, nullable=True)
     model_version = Column(String(20), nullable=True)
     error_message = Column(Text, nullable=True)
+    
+    session = relationship(
+        "TherapySession",
+        primaryjoin="TherapySession.id == foreign(Interaction.session_id)",
+        back_populates="interactions",
+        lazy="raise"
+    )
 
 class MoodEntry(Base):
     """Mood tracking entries."""
     __tablename__ = "mood_entries"
+    __table_args__ = (
+        # Covers the trend queries so Postgres can answer them with an index-only scan
+        Index("ix_mood_user_ts", "user_id", "timestamp", postgresql_include=["emotion", "intensity"]),
+        Index("ix_mood_ts", "timestamp", postgresql_include=["emotion"]),
+    )
     
     id = Column(ID_TYPE, primary_key=True, default=UUID_DEFAULT)
     user_id = Column(ID_TYPE, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, server_default=utc_now())
     
     # Mood data
     emotion = Column(String(50), nullable=False)
@@ -102,9 +313,10 @@ class MoodEntry(Base):
 class SystemMetrics(Base):
     """System performance and usage metrics."""
     __tablename__ = "system_metrics"
+    __table_args__ = (Index("ix_system_metrics_ts", "timestamp"), _MONTHLY_PARTITIONS)
     
     id = Column(ID_TYPE, primary_key=True, default=UUID_DEFAULT)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, server_default=utc_now(), primary_key=PARTITION_TABLES)
     
     # Performance metrics
     response_time_ms = Column(Integer, nullable=True)
@@ -121,6 +333,23 @@ class SystemMetrics(Base):
     stt_accuracy = Column(Float, nullable=True)
     model_loading_time_ms = Column(Integer, nullable=True)
 
+class DailyUserStats(Base):
+    """Per-user daily activity snapshot, rebuilt from the raw tables by refresh_daily_stats."""
+    __tablename__ = "daily_user_stats"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(ID_TYPE, primary_key=True)
+    
+    session_count = Column(Integer, default=0)
+    interaction_count = Column(Integer, default=0)
+    mood_entry_count = Column(Integer, default=0)
+    avg_duration_minutes = Column(Float, nullable=True)
+    emotion_counts = Column(JSON, nullable=True)  # Detected emotion -> interaction count
+    last_session_at = Column(DateTime, nullable=True)
+    last_mood_at = Column(DateTime, nullable=True)
+
+PARTITIONED_TABLES = (Interaction.__tablename__, SystemMetrics.__tablename__)
+
 class DatabaseManager:
     """Database manager for handling connections and operations."""
     
@@ -136,11 +365,72 @@ class DatabaseManager:
         finally:
             db.close()
     
+    @contextmanager
+    def transaction(self):
+        """Yield a session whose work is committed once on exit, or rolled back on error."""
+        db = self.SessionLocal()
+        try:
+            with db.begin():
+                yield db
+        finally:
+            db.close()
+    
     def create_tables(self):
         """Create all database tables."""
         Base.metadata.create_all(bind=self.engine)
+        if PARTITION_TABLES:
+            self.create_partitions()
         print("Database tables created successfully")
     
+    def create_partitions(self, months_ahead: int = 2):
+        """Create monthly partitions from the current month onwards; safe to re-run, so it is rolled
+        forward at startup and by the daily stats refresher before rows can spill into the default."""
+        month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        statements = []
+        for _ in range(months_ahead + 1):
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            for table in PARTITIONED_TABLES:
+                # Indexes declared on the parent table are created on each partition automatically
+                statements.append(
+                    f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+                )
+            month = next_month
+        # Rows outside the rolled range still have somewhere to go
+        statements.extend(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+                          for table in PARTITIONED_TABLES)
+        
+        with self.engine.begin() as conn:
+            for statement in statements:
+                # A month whose rows already landed in the default partition can't be attached;
+                # skip it instead of failing every other partition with it
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text(statement))
+                except SQLAlchemyError as e:
+                    print(f"Could not create partition ({statement}): {e}")
+    
+    def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """Drop monthly partitions that end on or before cutoff, purging their rows without a DELETE."""
+        dropped = []
+        with self.engine.begin() as conn:
+            for table in PARTITIONED_TABLES:
+                partitions = conn.execute(text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                    "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                    "WHERE parent.relname = :table"
+                ), {"table": table}).scalars().all()
+                for name in partitions:
+                    try:
+                        month = datetime.strptime(name[len(table) + 1:], "%Y_%m")
+                    except ValueError:
+                        continue  # The default partition
+                    if (month + timedelta(days=32)).replace(day=1) <= cutoff:
+                        conn.execute(text(f"DROP TABLE {name}"))
+                        dropped.append(name)
+        return dropped
+    
     def drop_tables(self):
         """Drop all database tables."""
         Base.metadata.drop_all(bind=self.engine)
@@ -167,137 +457,338 @@ def get_database():
 class DatabaseOperations:
     """Database operations for Voice CBT application."""
     
-    def __init__(self, db: Session):
+    __slots__ = ("db", "autocommit")
+    
+    def __init__(self, db: Session, autocommit: bool = True):
         self.db = db
+        # With autocommit off, writes are only flushed and the caller commits the whole unit of work
+        self.autocommit = autocommit
+    
+    def _save(self, obj):
+        """Persist a new object, committing it unless the caller owns the transaction."""
+        self.db.add(obj)
+        if self.autocommit:
+            self.db.commit()
+            self.db.refresh(obj)
+        else:
+            self.db.flush()
+        return obj
+    
+    def _commit(self):
+        """Commit pending changes unless the caller owns the transaction."""
+        if self.autocommit:
+            self.db.commit()
+        else:
+            self.db.flush()
     
     # User operations
     def create_user(self, username: str, email: Optional[str] = None) -> User:
         """Create a new user."""
-        user = User(username=username, email=email)
-        self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
-        return user
+        return self._save(User(username=username, email=email))
     
     def get_user(self, user_id: str) -> Optional[User]:
-        """Get user by ID."""
-        return self.db.query(User).filter(User.id == user_id).first()
+        """Get user by ID, served from the user cache when possible."""
+        user = _get_cached_user(self.db, ("id", str(user_id)))
+        if user is None:
+            user = self.db.query(User).filter(User.id == user_id).first()
+            if user:
+                _cache_user(self.db, user)
+        return user
     
     def get_user_by_username(self, username: str) -> Optional[User]:
-        """Get user by username."""
-        return self.db.query(User).filter(User.username == username).first()
+        """Get user by username, served from the user cache when possible."""
+        user = _get_cached_user(self.db, ("username", username))
+        if user is None:
+            user = self.db.query(User).filter(User.username == username).first()
+            if user:
+                _cache_user(self.db, user)
+        return user
     
     # Session operations
-    def create_session(self, user_id: str, session_type: str = "voice_cbt") -> Session:
+    def create_session(self, user_id: str, session_type: str = "voice_cbt") -> TherapySession:
         """Create a new therapy session."""
-        session = Session(
+        return self._save(TherapySession(
             user_id=user_id,
             session_type=session_type
-        )
-        self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
-        return session
+        ))
     
-    def get_session(self, session_id: str) -> Optional[Session]:
+    def get_session(self, session_id: str) -> Optional[TherapySession]:
         """Get session by ID."""
-        return self.db.query(Session).filter(Session.id == session_id).first()
+        return self.db.query(TherapySession).filter(TherapySession.id == session_id).first()
     
-    def update_session(self, session_id: str, **kwargs) -> Optional[Session]:
+    def update_session(self, session_id: str, **kwargs) -> Optional[TherapySession]:
         """Update session with new data."""
         session = self.get_session(session_id)
         if session:
             for key, value in kwargs.items():
                 setattr(session, key, value)
-            self.db.commit()
-            self.db.refresh(session)
+            self._commit()
+            if self.autocommit:
+                self.db.refresh(session)
         return session
     
-    def get_user_sessions(self, user_id: str, limit: int = 50) -> List[Session]:
+    def get_user_sessions(self, user_id: str, limit: int = 50) -> List[TherapySession]:
         """Get user's recent sessions."""
-        return self.db.query(Session).filter(
-            Session.user_id == user_id
-        ).order_by(Session.started_at.desc()).limit(limit).all()
+        return self.db.query(TherapySession).filter(
+            TherapySession.user_id == user_id
+        ).order_by(TherapySession.started_at.desc()).limit(limit).all()
+    
+    def get_user_session_stats(self, user_id: str) -> Tuple[int, Optional[datetime]]:
+        """Count a user's sessions and find the latest start, answered from the (user_id, started_at) index."""
+        count, last_started = self.db.query(
+            func.count(TherapySession.id),
+            func.max(TherapySession.started_at)
+        ).filter(TherapySession.user_id == user_id).one()
+        return count, last_started
     
     # Interaction operations
     def create_interaction(self, session_id: str, user_id: str, **kwargs) -> Interaction:
         """Create a new interaction."""
-        interaction = Interaction(
+        return self._save(Interaction(
             session_id=session_id,
             user_id=user_id,
             **kwargs
-        )
-        self.db.add(interaction)
-        self.db.commit()
-        self.db.refresh(interaction)
-        return interaction
+        ))
     
-    def get_session_interactions(self, session_id: str) -> List[Interaction]:
-        """Get all interactions for a session."""
+    def get_interaction_by_audio_hash(self, user_id: str, audio_data_hash: str) -> Optional[Interaction]:
+        """Get a user's interaction previously stored for the same audio, if any."""
         return self.db.query(Interaction).filter(
+            Interaction.user_id == user_id,
+            Interaction.audio_data_hash == audio_data_hash
+        ).first()
+    
+    def bulk_create_interactions(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert many interactions in one batched statement."""
+        if not rows:
+            return 0
+        self.db.execute(insert(Interaction), rows)
+        self._commit()
+        return len(rows)
+    
+    def get_session_interactions(self, session_id: str) -> List[Tuple]:
+        """Get a session's interactions, oldest first, as read-only (id, timestamp, transcribed_text,
+        detected_emotion, emotion_confidence, therapeutic_response) rows."""
+        # Plain column rows skip ORM hydration and the identity map; the statement is built once and cached
+        stmt = lambda_stmt(lambda: select(
+            Interaction.id,
+            Interaction.timestamp,
+            Interaction.transcribed_text,
+            Interaction.detected_emotion,
+            Interaction.emotion_confidence,
+            Interaction.therapeutic_response
+        ))
+        stmt += lambda s: s.where(Interaction.session_id == session_id).order_by(Interaction.timestamp.asc())
+        return self.db.execute(stmt).all()
+    
+    def get_session_stats(self, session_id: str) -> Dict[str, Any]:
+        """Aggregate a session's interactions in the database: one row per detected emotion."""
+        confidence = Interaction.emotion_confidence
+        # Zero and missing confidences are left out of the average, as are blank error messages from the error count
+        scored = case((and_(confidence.isnot(None), confidence != 0), confidence))
+        failed = case((and_(Interaction.error_message.isnot(None), Interaction.error_message != ""), 1), else_=0)
+        
+        grouped = self.db.query(
+            Interaction.detected_emotion,
+            func.count(Interaction.id),
+            func.sum(scored),
+            func.count(scored),
+            func.sum(failed)
+        ).filter(
             Interaction.session_id == session_id
-        ).order_by(Interaction.timestamp.asc()).all()
+        ).group_by(Interaction.detected_emotion).order_by(func.min(Interaction.timestamp)).all()
+        
+        confidence_total = sum(float(total) for _, _, total, _, _ in grouped if total is not None)
+        confidence_count = sum(count for _, _, _, count, _ in grouped)
+        return {
+            "total_interactions": sum(count for _, count, _, _, _ in grouped),
+            # Groups come back in order of each emotion's first interaction
+            "emotion_distribution": {emotion: count for emotion, count, _, _, _ in grouped if emotion},
+            "average_confidence": confidence_total / confidence_count if confidence_count else 0,
+            "processing_errors": sum(int(errors) for _, _, _, _, errors in grouped)
+        }
     
     # Mood operations
     def create_mood_entry(self, user_id: str, emotion: str, intensity: int, **kwargs) -> MoodEntry:
         """Create a new mood entry."""
-        mood_entry = MoodEntry(
+        return self._save(MoodEntry(
             user_id=user_id,
             emotion=emotion,
             intensity=intensity,
             **kwargs
-        )
-        self.db.add(mood_entry)
-        self.db.commit()
-        self.db.refresh(mood_entry)
-        return mood_entry
+        ))
     
     def get_user_mood_history(self, user_id: str, days: int = 30) -> List[MoodEntry]:
         """Get user's mood history."""
-        from datetime import timedelta
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        return self.db.query(MoodEntry).filter(
+        stmt = lambda_stmt(lambda: select(MoodEntry))
+        stmt += lambda s: s.where(
             MoodEntry.user_id == user_id,
             MoodEntry.timestamp >= cutoff_date
-        ).order_by(MoodEntry.timestamp.desc()).all()
+        ).order_by(MoodEntry.timestamp.desc())
+        return self.db.execute(stmt).scalars().all()
     
-    def get_mood_trends(self, user_id: str, days: int = 30) -> Dict[str, Any]:
-        """Get mood trends for a user."""
-        mood_history = self.get_user_mood_history(user_id, days)
+    def count_user_mood_entries(self, user_id: str, days: int = 30) -> int:
+        """Count a user's mood entries without loading them."""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        if not mood_history:
-            return {"trends": [], "average_intensity": 0, "emotion_distribution": {}}
+        return self.db.query(func.count(MoodEntry.id)).filter(
+            MoodEntry.user_id == user_id,
+            MoodEntry.timestamp >= cutoff_date
+        ).scalar()
+    
+    def get_mood_trends(self, user_id: str, days: int = 30, include_trends: bool = True) -> Dict[str, Any]:
+        """Get mood trends for a user; pass include_trends=False to skip loading the entries."""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Calculate trends
-        emotions = [entry.emotion for entry in mood_history]
-        intensities = [entry.intensity for entry in mood_history]
+        # One row per emotion; the overall average is weighted back together below.
+        # Built as a cached lambda statement: user_id and the cutoff are always bound parameters
+        stmt = lambda_stmt(lambda: select(MoodEntry.emotion, func.count(MoodEntry.id), func.avg(MoodEntry.intensity)))
+        stmt += lambda s: s.where(
+            MoodEntry.user_id == user_id,
+            MoodEntry.timestamp >= cutoff_date
+        ).group_by(MoodEntry.emotion)
+        grouped = self.db.execute(stmt).all()
+        
+        if not grouped:
+            return {"trends": [], "average_intensity": 0, "emotion_distribution": {}}
         
-        emotion_counts = {}
-        for emotion in emotions:
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        emotion_counts = {emotion: count for emotion, count, _ in grouped}
+        total_entries = sum(emotion_counts.values())
         
         return {
-            "trends": mood_history,
-            "average_intensity": sum(intensities) / len(intensities),
+            "trends": self.get_user_mood_history(user_id, days) if include_trends else [],
+            "average_intensity": sum(count * float(avg) for _, count, avg in grouped) / total_entries,
             "emotion_distribution": emotion_counts,
-            "total_entries": len(mood_history)
+            "total_entries": total_entries
+        }
+    
+    def get_mood_summary(self, user_id: str, days: int = 30) -> Dict[str, Any]:
+        """Aggregate a user's mood entries in the database instead of in Python."""
+        now = datetime.utcnow()
+        window = (
+            MoodEntry.user_id == user_id,
+            MoodEntry.timestamp >= now - timedelta(days=days)
+        )
+        
+        total, average, minimum, maximum, recent_week = self.db.query(
+            func.count(MoodEntry.id),
+            func.avg(MoodEntry.intensity),
+            func.min(MoodEntry.intensity),
+            func.max(MoodEntry.intensity),
+            func.coalesce(func.sum(case((MoodEntry.timestamp >= now - timedelta(days=7), 1), else_=0)), 0)
+        ).filter(*window).one()
+        
+        if not total:
+            return {"total_entries": 0, "emotion_distribution": {}, "timeline": []}
+        
+        distribution = dict(
+            self.db.query(MoodEntry.emotion, func.count(MoodEntry.id))
+            .filter(*window)
+            .group_by(MoodEntry.emotion)
+            .all()
+        )
+        
+        # Oldest ten entries in the window, newest first
+        timeline = self.db.query(
+            MoodEntry.timestamp, MoodEntry.emotion, MoodEntry.intensity
+        ).filter(*window).order_by(MoodEntry.timestamp.asc()).limit(10).all()
+        
+        return {
+            "total_entries": total,
+            "average_intensity": float(average),
+            "min_intensity": minimum,
+            "max_intensity": maximum,
+            "recent_week_entries": int(recent_week),
+            "emotion_distribution": distribution,
+            "timeline": timeline[::-1]
         }
     
     # Metrics operations
     def create_system_metric(self, **kwargs) -> SystemMetrics:
         """Create a system metrics entry."""
-        metric = SystemMetrics(**kwargs)
-        self.db.add(metric)
-        self.db.commit()
-        self.db.refresh(metric)
-        return metric
+        return self._save(SystemMetrics(**kwargs))
+    
+    def bulk_create_metrics(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert many system metrics entries in one batched statement."""
+        if not rows:
+            return 0
+        self.db.execute(insert(SystemMetrics), rows)
+        self._commit()
+        return len(rows)
     
     def get_recent_metrics(self, hours: int = 24) -> List[SystemMetrics]:
         """Get recent system metrics."""
-        from datetime import timedelta
         cutoff_time = datetime.utcnow() - timedelta(hours=hours)
         
-        return self.db.query(SystemMetrics).filter(
-            SystemMetrics.timestamp >= cutoff_time
-        ).order_by(SystemMetrics.timestamp.desc()).all()
+        stmt = lambda_stmt(lambda: select(SystemMetrics))
+        stmt += lambda s: s.where(SystemMetrics.timestamp >= cutoff_time).order_by(SystemMetrics.timestamp.desc())
+        return self.db.execute(stmt).scalars().all()
+    
+    def iter_recent_metrics(self, hours: int = 24, batch_size: int = 500) -> Iterator[SystemMetrics]:
+        """Stream recent system metrics through a server-side cursor, batch_size rows at a time."""
+        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        
+        stmt = lambda_stmt(lambda: select(SystemMetrics))
+        stmt += lambda s: s.where(SystemMetrics.timestamp >= cutoff_time)
+        yield from self.db.execute(stmt, execution_options={"yield_per": batch_size}).scalars()
+    
+    # Daily snapshot operations
+    def refresh_daily_stats(self, day: date) -> int:
+        """Rebuild the daily_user_stats rows for one day from the raw tables; returns the rows written."""
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        rows = {}
+        
+        def row(user_id):
+            return rows.setdefault(user_id, {
+                "day": day, "user_id": user_id, "session_count": 0, "interaction_count": 0,
+                "mood_entry_count": 0, "avg_duration_minutes": None, "emotion_counts": {},
+                "last_session_at": None, "last_mood_at": None
+            })
+        
+        for user_id, count, avg_duration, last_session in self.db.query(
+            TherapySession.user_id,
+            func.count(TherapySession.id),
+            func.avg(TherapySession.duration_minutes),
+            func.max(TherapySession.started_at)
+        ).filter(
+            TherapySession.started_at >= start, TherapySession.started_at < end
+        ).group_by(TherapySession.user_id):
+            row(user_id).update(
+                session_count=count,
+                avg_duration_minutes=float(avg_duration) if avg_duration is not None else None,
+                last_session_at=last_session
+            )
+        
+        for user_id, emotion, count in self.db.query(
+            Interaction.user_id, Interaction.detected_emotion, func.count(Interaction.id)
+        ).filter(
+            Interaction.timestamp >= start, Interaction.timestamp < end
+        ).group_by(Interaction.user_id, Interaction.detected_emotion):
+            stats = row(user_id)
+            stats["interaction_count"] += count
+            if emotion:
+                stats["emotion_counts"][emotion] = count
+        
+        for user_id, count, last_mood in self.db.query(
+            MoodEntry.user_id, func.count(MoodEntry.id), func.max(MoodEntry.timestamp)
+        ).filter(
+            MoodEntry.timestamp >= start, MoodEntry.timestamp < end
+        ).group_by(MoodEntry.user_id):
+            row(user_id).update(mood_entry_count=count, last_mood_at=last_mood)
+        
+        # Upsert instead of delete-and-insert, so workers refreshing the same day can't collide on the key
+        if rows:
+            stmt = dialect_insert(DailyUserStats.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["day", "user_id"],
+                set_={name: stmt.excluded[name] for name in next(iter(rows.values())) if name not in ("day", "user_id")}
+            )
+            self.db.execute(stmt, list(rows.values()))
+        # Users with no remaining activity drop out of the day
+        self.db.execute(delete(DailyUserStats).where(
+            DailyUserStats.day == day, DailyUserStats.user_id.notin_(list(rows))
+        ))
+        self._commit()
+        return len(rows)
@@ -4,21 +4,81 @@ Dynamically adapts responses based on real-time user feedback and engagement
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Per-user state is kept for the most recently active users only
+MAX_TRACKED_USERS = 10000
+ENGAGEMENT_HISTORY_SIZE = 50
+
+# Keyword scans used for scoring, compiled once; substring matches like the old `word in text.lower()`
+_EMPATHY_RE = re.compile(r"understand|hear|sense|feel", re.IGNORECASE)
+_THERAPEUTIC_RE = re.compile(r"explore|together|process|work through|cope", re.IGNORECASE)
+_EFFECTIVE_LANGUAGE_RE = re.compile(r"together|explore|understand", re.IGNORECASE)
+
+# Responses are split on '. ' with the separator kept, so joining the pieces gives back the exact text
+_SENTENCE_SPLIT_RE = re.compile(r"(\. )")
+_SENTENCE_SEPARATOR = ". "
+_EXCLAMATION_TO_PERIOD = str.maketrans("!", ".")
+_ENCOURAGING_STARTERS = (
+    "I believe in your ability to work through this",
+    "You're taking important steps forward",
+    "Your courage in sharing this is admirable"
+)
+_VALIDATION_PHRASES = {
+    "anxiety": "Your anxiety is completely understandable",
+    "depression": "What you're feeling is valid and important",
+    "anger": "Your anger makes sense given the situation",
+    "stress": "It's completely normal to feel stressed"
+}
+
+class EngagementMetricsBuffer:
+    """Ring buffer of a user's recent engagement metrics, one array per field"""
+    
+    __slots__ = ("timestamps", "response_times", "emotion_intensities", "conversation_flows", "head", "count")
+    
+    def __init__(self, size: int = ENGAGEMENT_HISTORY_SIZE):
+        self.timestamps = np.empty(size, dtype=np.float64)
+        self.response_times = np.empty(size, dtype=np.float32)
+        self.emotion_intensities = np.empty(size, dtype=np.float32)
+        self.conversation_flows = [None] * size
+        self.head = 0
+        self.count = 0
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def append(self, timestamp: float, response_time: float, emotion_intensity: float, conversation_flow: str):
+        """Record one entry, overwriting the oldest once the buffer is full"""
+        i = self.head
+        self.timestamps[i] = timestamp
+        self.response_times[i] = response_time
+        self.emotion_intensities[i] = emotion_intensity
+        self.conversation_flows[i] = conversation_flow
+        self.head = (i + 1) % len(self.timestamps)
+        self.count = min(self.count + 1, len(self.timestamps))
+
 class AdaptiveResponseSystem:
     """Adapts responses based on user engagement and feedback"""
     
     def __init__(self):
-        self.user_engagement_history = {}
+        self.user_engagement_history = OrderedDict()
         self.response_effectiveness = {}
         self.adaptation_rules = self._load_adaptation_rules()
-        self.engagement_metrics = {}
+        self._strategy_cache = self._build_strategy_cache()
+        self.engagement_metrics = OrderedDict()
+        
+        # Dispatch tables from strategy values to the adapters that apply them
+        self._length_adapters = {"shorter": self._shorten_response, "longer": self._lengthen_response}
+        self._tone_adapters = {"more_encouraging": self._make_more_encouraging, "more_therapeutic": self._make_more_therapeutic}
+        self._pace_adapters = {"slower": self._slow_down_pace, "calm": self._calm_tone}
+        self._validation_adapters = {"high": self._add_high_validation, "very_high": self._add_very_high_validation}
     
     def _load_adaptation_rules(self) -> Dict[str, Dict]:
         """Load rules for response adaptation"""
@@ -73,6 +133,25 @@ class AdaptiveResponseSystem:
             }
         }
     
+    def _build_strategy_cache(self) -> Dict[Tuple[str, Optional[str], Optional[str]], Dict]:
+        """Merge every engagement/emotion/session rule combination once, up front"""
+        rules = self.adaptation_rules
+        cache = {}
+        
+        # None stands for an emotion or session stage without rules of its own
+        for level, base_strategy in rules["engagement_based"].items():
+            for emotion in (None, *rules["emotion_based"]):
+                emotion_adjustments = rules["emotion_based"].get(emotion, {})
+                for stage in (None, *rules["session_based"]):
+                    session_adjustments = rules["session_based"].get(stage, {})
+                    cache[(level, emotion, stage)] = {
+                        **base_strategy,
+                        **emotion_adjustments,
+                        **session_adjustments
+                    }
+        
+        return cache
+    
     def adapt_response(self, 
                       base_response: str,
                       user_id: str,
@@ -124,19 +203,27 @@ class AdaptiveResponseSystem:
                 "error": str(e)
             }
     
+    def _get_user_state(self, store: OrderedDict, user_id: str, factory: Callable[[], Any]) -> Any:
+        """Get a user's entry in an LRU-bounded store, creating it if needed"""
+        state = store.get(user_id)
+        if state is None:
+            state = store[user_id] = factory()
+            if len(store) > MAX_TRACKED_USERS:
+                store.popitem(last=False)  # Evict the least recently active user
+        else:
+            store.move_to_end(user_id)
+        return state
+    
     def _get_user_engagement_profile(self, user_id: str) -> Dict:
         """Get user's engagement profile"""
-        if user_id not in self.user_engagement_history:
-            self.user_engagement_history[user_id] = {
-                "total_sessions": 0,
-                "avg_response_time": 0,
-                "preferred_response_length": "medium",
-                "engagement_trend": "stable",
-                "effective_techniques": [],
-                "challenging_areas": []
-            }
-        
-        return self.user_engagement_history[user_id]
+        return self._get_user_state(self.user_engagement_history, user_id, lambda: {
+            "total_sessions": 0,
+            "avg_response_time": 0,
+            "preferred_response_length": "medium",
+            "engagement_trend": "stable",
+            "effective_techniques": [],
+            "challenging_areas": []
+        })
     
     def _analyze_session_dynamics(self, session_context: Dict, metrics: Dict) -> Dict:
         """Analyze current session dynamics"""
@@ -163,29 +250,22 @@ class AdaptiveResponseSystem:
                                   engagement_profile: Dict,
                                   emotion: str,
                                   session_dynamics: Dict) -> Dict:
-        """Select the best adaptation strategy"""
+        """Select the best adaptation strategy (shared, precomputed; do not mutate)"""
         
         # Base strategy from engagement level
         if engagement_profile.get("engagement_level", "medium") == "low":
-            base_strategy = self.adaptation_rules["engagement_based"]["low_engagement"]
+            level = "low_engagement"
         else:
-            base_strategy = self.adaptation_rules["engagement_based"]["high_engagement"]
-        
-        # Emotion-based adjustments
-        emotion_adjustments = self.adaptation_rules["emotion_based"].get(emotion, {})
+            level = "high_engagement"
         
-        # Session-based adjustments
+        # Emotions and stages without rules fall back to the combination that ignores them
+        if emotion not in self.adaptation_rules["emotion_based"]:
+            emotion = None
         session_stage = session_dynamics["session_stage"]
-        session_adjustments = self.adaptation_rules["session_based"].get(session_stage, {})
+        if session_stage not in self.adaptation_rules["session_based"]:
+            session_stage = None
         
-        # Combine strategies
-        strategy = {
-            **base_strategy,
-            **emotion_adjustments,
-            **session_adjustments
-        }
-        
-        return strategy
+        return self._strategy_cache[(level, emotion, session_stage)]
     
     def _apply_adaptations(self, 
                           response: str, 
@@ -193,100 +273,68 @@ class AdaptiveResponseSystem:
                           emotion: str) -> str:
         """Apply adaptations to the response"""
         
-        adapted_response = response
-        
-        # Adjust response length
-        if strategy.get("response_length") == "shorter":
-            adapted_response = self._shorten_response(adapted_response)
-        elif strategy.get("response_length") == "longer":
-            adapted_response = self._lengthen_response(adapted_response)
-        
-        # Adjust tone
-        if strategy.get("tone") == "more_encouraging":
-            adapted_response = self._make_more_encouraging(adapted_response)
-        elif strategy.get("tone") == "more_therapeutic":
-            adapted_response = self._make_more_therapeutic(adapted_response)
-        
-        # Adjust pace
-        if strategy.get("pace") == "slower":
-            adapted_response = self._slow_down_pace(adapted_response)
-        elif strategy.get("pace") == "calm":
-            adapted_response = self._calm_tone(adapted_response)
-        
-        # Add validation based on level
-        validation_level = strategy.get("validation", "medium")
-        if validation_level == "high":
-            adapted_response = self._add_high_validation(adapted_response, emotion)
-        elif validation_level == "very_high":
-            adapted_response = self._add_very_high_validation(adapted_response, emotion)
-        
-        return adapted_response
+        # Adjust response length, tone and pace, then add validation based on level
+        adapters = [table.get(strategy.get(key))
+                    for table, key in ((self._length_adapters, "response_length"),
+                                       (self._tone_adapters, "tone"),
+                                       (self._pace_adapters, "pace"))]
+        add_validation = self._validation_adapters.get(strategy.get("validation", "medium"))
+        if not any(adapters) and not add_validation:
+            return response
+        
+        # Adapters edit the piece list in place: sentences at even indexes, the '. ' after each at odd
+        # ones. The text is joined once at the end
+        pieces = _SENTENCE_SPLIT_RE.split(response)
+        for adapter in adapters:
+            if adapter:
+                adapter(pieces)
+        if add_validation:
+            add_validation(pieces, emotion)
+        
+        return "".join(pieces)
     
-    def _shorten_response(self, response: str) -> str:
+    def _shorten_response(self, pieces: List[str]):
         """Shorten response while maintaining therapeutic value"""
-        sentences = response.split('. ')
-        if len(sentences) > 2:
+        if len(pieces) > 4:
             # Keep the most important sentences
-            return '. '.join(sentences[:2]) + '.'
-        return response
+            del pieces[3:]
+            pieces[-1] += '.'
     
-    def _lengthen_response(self, response: str) -> str:
+    def _lengthen_response(self, pieces: List[str]):
         """Lengthen response with additional therapeutic content"""
-        if not response.endswith('?'):
-            response += " How does that feel to you?"
-        return response
+        if not pieces[-1].endswith('?'):
+            pieces[-1] += " How does that feel to you?"
     
-    def _make_more_encouraging(self, response: str) -> str:
+    def _make_more_encouraging(self, pieces: List[str]):
         """Make response more encouraging"""
-        encouraging_starters = [
-            "I believe in your ability to work through this",
-            "You're taking important steps forward",
-            "Your courage in sharing this is admirable"
-        ]
-        
-        if not any(starter in response for starter in encouraging_starters):
-            response = f"{encouraging_starters[0]}. {response}"
-        
-        return response
+        if not any(starter in piece for piece in pieces for starter in _ENCOURAGING_STARTERS):
+            pieces[:0] = (_ENCOURAGING_STARTERS[0], _SENTENCE_SEPARATOR)
     
-    def _make_more_therapeutic(self, response: str) -> str:
+    def _make_more_therapeutic(self, pieces: List[str]):
         """Make response more therapeutically focused"""
-        if "let's explore" not in response.lower():
-            response += " Let's explore this together and find a path forward."
-        return response
+        if not any("let's explore" in piece.lower() for piece in pieces):
+            pieces[-1] += " Let's explore this together and find a path forward."
     
-    def _slow_down_pace(self, response: str) -> str:
+    def _slow_down_pace(self, pieces: List[str]):
         """Slow down the pace of the response"""
-        response = response.replace("!", ".")
-        response = response.replace("urgent", "important")
-        return response
+        pieces[:] = [piece.translate(_EXCLAMATION_TO_PERIOD).replace("urgent", "important")
+                     for piece in pieces]
     
-    def _calm_tone(self, response: str) -> str:
+    def _calm_tone(self, pieces: List[str]):
         """Make the tone more calm"""
-        response = response.replace("!", ".")
-        response = response.replace("need to", "might consider")
-        return response
+        pieces[:] = [piece.translate(_EXCLAMATION_TO_PERIOD).replace("need to", "might consider")
+                     for piece in pieces]
     
-    def _add_high_validation(self, response: str, emotion: str) -> str:
+    def _add_high_validation(self, pieces: List[str], emotion: str):
         """Add high level of validation"""
-        validation_phrases = {
-            "anxiety": "Your anxiety is completely understandable",
-            "depression": "What you're feeling is valid and important",
-            "anger": "Your anger makes sense given the situation",
-            "stress": "It's completely normal to feel stressed"
-        }
-        
-        phrase = validation_phrases.get(emotion, "Your feelings are completely valid")
-        if phrase not in response:
-            response = f"{phrase}. {response}"
-        
-        return response
+        phrase = _VALIDATION_PHRASES.get(emotion, "Your feelings are completely valid")
+        if not any(phrase in piece for piece in pieces):
+            pieces[:0] = (phrase, _SENTENCE_SEPARATOR)
     
-    def _add_very_high_validation(self, response: str, emotion: str) -> str:
+    def _add_very_high_validation(self, pieces: List[str], emotion: str):
         """Add very high level of validation"""
-        response = self._add_high_validation(response, emotion)
-        response = f"I want you to know that you're not alone in this. {response}"
-        return response
+        self._add_high_validation(pieces, emotion)
+        pieces[:0] = ("I want you to know that you're not alone in this", _SENTENCE_SEPARATOR)
     
     def _generate_adaptive_follow_ups(self, 
                                    response: str, 
@@ -320,19 +368,14 @@ class AdaptiveResponseSystem:
     
     def _update_engagement_tracking(self, user_id: str, metrics: Dict):
         """Update user engagement tracking"""
-        if user_id not in self.engagement_metrics:
-            self.engagement_metrics[user_id] = []
-        
-        self.engagement_metrics[user_id].append({
-            "timestamp": datetime.now(),
-            "response_time": metrics.get("response_time", 0),
-            "emotion_intensity": metrics.get("emotion_intensity", 0.5),
-            "conversation_flow": metrics.get("conversation_flow", "normal")
-        })
-        
-        # Keep only last 50 entries
-        if len(self.engagement_metrics[user_id]) > 50:
-            self.engagement_metrics[user_id] = self.engagement_metrics[user_id][-50:]
+        # The buffer keeps only the last ENGAGEMENT_HISTORY_SIZE entries
+        user_metrics = self._get_user_state(self.engagement_metrics, user_id, EngagementMetricsBuffer)
+        user_metrics.append(
+            time.time(),
+            metrics.get("response_time", 0),
+            metrics.get("emotion_intensity", 0.5),
+            metrics.get("conversation_flow", "normal")
+        )
     
     def _calculate_adaptation_score(self, response: str) -> float:
         """Calculate how well the response was adapted"""
@@ -343,7 +386,7 @@ class AdaptiveResponseSystem:
             score += 0.3
         
         # Empathy presence
-        if any(word in response.lower() for word in ["understand", "hear", "sense", "feel"]):
+        if _EMPATHY_RE.search(response):
             score += 0.3
         
         # Question presence
@@ -351,8 +394,7 @@ class AdaptiveResponseSystem:
             score += 0.2
         
         # Therapeutic language
-        therapeutic_words = ["explore", "together", "process", "work through", "cope"]
-        if any(word in response.lower() for word in therapeutic_words):
+        if _THERAPEUTIC_RE.search(response):
             score += 0.2
         
         return min(score, 1.0)
@@ -371,7 +413,7 @@ class AdaptiveResponseSystem:
         if "?" in response and len(response) > 50:
             base_effectiveness += 0.1
         
-        if any(word in response.lower() for word in ["together", "explore", "understand"]):
+        if _EFFECTIVE_LANGUAGE_RE.search(response):
             base_effectiveness += 0.1
         
         # Final prediction
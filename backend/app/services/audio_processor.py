@@ -3,15 +3,26 @@ Audio processing service for handling audio files and transcription.
 This service provides proper audio file handling and preprocessing.
 """
 
+import io
 import os
-import base64
 import tempfile
+import threading
 import wave
 import numpy as np
 import librosa
 from typing import Optional, Tuple
 import soundfile as sf
 
+try:
+    # SIMD-accelerated drop-in for the stdlib decoder; large audio payloads decode several times faster
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# Per-thread decode buffer reused across requests instead of allocating a fresh array each time
+MAX_BUFFER_SECONDS = 30
+_decode_buffers = threading.local()
+
 class AudioProcessor:
     """
     Service for processing audio files and preparing them for transcription.
@@ -55,7 +66,7 @@ class AudioProcessor:
     
     def load_audio_file(self, file_path: str) -> Tuple[np.ndarray, int]:
         """
-        Load audio file using librosa.
+        Load audio file as mono float32 at the target sample rate.
         
         Args:
             file_path: Path to the audio file
@@ -64,11 +75,61 @@ class AudioProcessor:
             Tuple of (audio_array, sample_rate)
         """
         try:
-            audio, sr = librosa.load(file_path, sr=self.target_sample_rate)
-            return audio, sr
+            try:
+                return self._read_soundfile(file_path)
+            except sf.LibsndfileError:
+                # Formats libsndfile can't read (e.g. some MP3s) go through librosa's audioread fallback
+                return librosa.load(file_path, sr=self.target_sample_rate)
         except Exception as e:
             raise ValueError(f"Failed to load audio file {file_path}: {e}")
     
+    def load_audio_bytes(self, audio_bytes: bytes, reuse_buffer: bool = False) -> Tuple[np.ndarray, int]:
+        """
+        Load in-memory audio without writing it to disk.
+        
+        Args:
+            audio_bytes: Raw audio data in a format libsndfile can decode
+            reuse_buffer: Decode into this thread's preallocated buffer; the returned
+                array may then be a view that is only valid until the next call on this thread
+            
+        Returns:
+            Tuple of (audio_array, sample_rate)
+            
+        Raises:
+            soundfile.LibsndfileError: If libsndfile can't decode the data
+        """
+        return self._read_soundfile(io.BytesIO(audio_bytes), reuse_buffer)
+    
+    def _read_soundfile(self, source, reuse_buffer: bool = False) -> Tuple[np.ndarray, int]:
+        """Decode a path or file object with soundfile at the target sample rate."""
+        with sf.SoundFile(source) as f:
+            out = self._decode_buffer(f.frames) if reuse_buffer and f.channels == 1 else None
+            if out is not None:
+                audio = f.read(out=out)
+            else:
+                audio = f.read(dtype="float32", always_2d=False)
+            sr = f.samplerate
+        return self._to_target_rate(audio, sr), self.target_sample_rate
+    
+    def _decode_buffer(self, frames: int) -> Optional[np.ndarray]:
+        """This thread's float32 decode buffer trimmed to frames, or None if the audio is too long for it."""
+        capacity = MAX_BUFFER_SECONDS * self.target_sample_rate
+        if frames > capacity:
+            return None
+        
+        buffer = getattr(_decode_buffers, "audio", None)
+        if buffer is None or len(buffer) < capacity:
+            buffer = _decode_buffers.audio = np.empty(capacity, dtype=np.float32)
+        return buffer[:frames]
+    
+    def _to_target_rate(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Downmix to mono and resample only when the source rate differs from the target."""
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1, dtype=np.float32)
+        if sample_rate != self.target_sample_rate:
+            audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=self.target_sample_rate, res_type="soxr_hq")
+        return audio
+    
     def preprocess_audio(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
         """
         Preprocess audio for better transcription quality.
@@ -81,20 +142,34 @@ class AudioProcessor:
             Preprocessed audio array
         """
         try:
-            # Normalize audio
-            audio = librosa.util.normalize(audio)
+            # Peak-normalize: two reductions that allocate nothing, then a single scaling pass
+            peak = max(audio.max(), -audio.min()) if audio.size else 0
+            if peak > np.finfo(audio.dtype).tiny:
+                audio = audio * audio.dtype.type(1.0 / peak)
             
             # Remove silence from the beginning and end
             audio, _ = librosa.effects.trim(audio, top_db=20)
             
             # Apply noise reduction (simple approach)
-            audio = librosa.effects.preemphasis(audio)
+            audio = self._preemphasis(audio)
             
             return audio
         except Exception as e:
             print(f"Warning: Audio preprocessing failed: {e}")
             return audio
     
+    def _preemphasis(self, audio: np.ndarray, coef: float = 0.97) -> np.ndarray:
+        """First-order preemphasis y[n] = x[n] - coef * x[n-1] as slice arithmetic instead of an lfilter call."""
+        if len(audio) < 2:
+            return audio
+        
+        emphasized = np.empty_like(audio)
+        np.multiply(audio[:-1], -coef, out=emphasized[1:])
+        emphasized[1:] += audio[1:]
+        # Same initial condition as librosa.effects.preemphasis: x[-1] extrapolated as 2*x[0] - x[1]
+        emphasized[0] = 3 * audio[0] - audio[1]
+        return emphasized
+    
     def process_base64_audio(self, base64_audio: str) -> Tuple[np.ndarray, int, str]:
         """
         Complete audio processing pipeline from base64 to processed audio.
@@ -103,20 +178,27 @@ class AudioProcessor:
             base64_audio: Base64 encoded audio string
             
         Returns:
-            Tuple of (processed_audio, sample_rate, temp_file_path)
+            Tuple of (processed_audio, sample_rate, temp_file_path); temp_file_path
+            is None unless the audio had to be decoded from a temporary file
         """
         try:
             # Step 1: Decode base64 audio
             audio_bytes = self.decode_base64_audio(base64_audio)
             
-            # Step 2: Save to temporary file
-            temp_file_path = self.save_audio_to_temp_file(audio_bytes)
-            
-            # Step 3: Load audio file
-            audio, sample_rate = self.load_audio_file(temp_file_path)
+            # Step 2: Load audio straight from memory; only formats libsndfile
+            # can't decode are saved to a temporary file for librosa
+            temp_file_path = None
+            try:
+                audio, sample_rate = self.load_audio_bytes(audio_bytes, reuse_buffer=True)
+            except sf.LibsndfileError:
+                temp_file_path = self.save_audio_to_temp_file(audio_bytes)
+                audio, sample_rate = self.load_audio_file(temp_file_path)
             
-            # Step 4: Preprocess audio
+            # Step 3: Preprocess audio
             processed_audio = self.preprocess_audio(audio, sample_rate)
+            if np.shares_memory(processed_audio, getattr(_decode_buffers, "audio", ())):
+                # Never hand the thread's decode buffer to the caller
+                processed_audio = processed_audio.copy()
             
             print(f"Audio processing successful: {len(processed_audio)} samples at {sample_rate}Hz")
             return processed_audio, sample_rate, temp_file_path
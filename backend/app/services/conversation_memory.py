@@ -2,9 +2,59 @@
 Conversation memory service for tracking user sessions and conversation history.
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+from array import array
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 import json
+import logging
+import re
+import time
+
+try:
+    # RE2 matches the keyword alternation with a DFA, without backtracking
+    import re2 as _re
+except ImportError:
+    _re = re
+
+# Common therapeutic topics
+TOPIC_KEYWORDS = {
+    "anxiety": ["anxious", "worry", "nervous", "panic", "fear"],
+    "depression": ["sad", "depressed", "down", "hopeless", "blue"],
+    "stress": ["stressed", "overwhelmed", "pressure", "tension"],
+    "relationships": ["relationship", "partner", "family", "friend", "social"],
+    "work": ["work", "job", "career", "boss", "colleague"],
+    "health": ["health", "sick", "pain", "medical", "doctor"],
+    "sleep": ["sleep", "insomnia", "tired", "exhausted"],
+    "self-esteem": ["confidence", "self-worth", "value", "worthless"],
+    "trauma": ["trauma", "abuse", "ptsd", "flashback", "trigger"]
+}
+
+logger = logging.getLogger(__name__)
+
+# Fixed emotion vocabulary; sessions store indices into this table instead of strings.
+# Labels outside it share the trailing "other" id, so the table and the ids stay bounded.
+EMOTIONS = (
+    "neutral", "happiness", "sadness", "anger", "fear", "surprise", "disgust", "anxiety",
+    "frustration", "excitement", "depression", "stress", "happy", "sad", "angry", "calm", "other"
+)
+EMOTION_IDS = {emotion: i for i, emotion in enumerate(EMOTIONS)}
+OTHER_EMOTION_ID = EMOTION_IDS["other"]
+
+# Every keyword in one alternation, so a single pass over the text finds all of them;
+# longest first so a compound keyword wins over any keyword it starts with
+KEYWORD_TOPICS = {keyword: topic for topic, keywords in TOPIC_KEYWORDS.items() for keyword in keywords}
+_TOPIC_PATTERN = _re.compile(
+    r"\b(" + "|".join(re.escape(k) for k in sorted(KEYWORD_TOPICS, key=len, reverse=True)) + r")\b"
+)
+
+@lru_cache(maxsize=4096)
+def _extract_topics(text: str) -> Tuple[str, ...]:
+    """Extract topics from user input; pure over the text, so repeated phrasings hit the cache."""
+    found = {KEYWORD_TOPICS[keyword] for keyword in _TOPIC_PATTERN.findall(text.lower())}
+    return tuple(topic for topic in TOPIC_KEYWORDS if topic in found)
 
 class ConversationMemory:
     """
@@ -12,8 +62,12 @@ class ConversationMemory:
     """
     
     def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
+        # Ordered least recently used first, so eviction and the idle sweep both work from the front
+        self.sessions: Dict[str, Dict[str, Any]] = OrderedDict()
+        self.max_sessions = 1000
+        self.session_ttl_seconds = 3600  # Sessions idle for an hour are dropped
         self.max_session_length = 20  # Keep last 20 exchanges per session
+        self.max_emotion_history = 100  # Emotion trends look further back than the exchanges
     
     def start_session(self, session_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -26,17 +80,32 @@ class ConversationMemory:
         Returns:
             Session information
         """
+        self._evict_idle_sessions()
+        
+        started = datetime.now()
         self.sessions[session_id] = {
             "session_id": session_id,
             "user_id": user_id,
-            "start_time": datetime.now().isoformat(),
-            "conversation_history": [],
-            "emotion_history": [],
+            "start_time": started.isoformat(),
+            # Epoch seconds alongside the ISO strings, so durations are a subtraction rather than two parses
+            "start_ts": started.timestamp(),
+            "last_exchange_ts": None,
+            # Bounded deques drop the oldest entry on append instead of re-slicing the list
+            "conversation_history": deque(maxlen=self.max_session_length),
+            # Emotion history as parallel columns: interned label ids, epoch timestamps and confidences
+            "emotion_ids": array("B"),
+            "emotion_ts": array("d"),
+            "emotion_conf": array("f"),
+            "emotion_counts": Counter(),  # Distribution over emotion_ids, kept in step with it
             "topics_discussed": set(),
-            "session_summary": ""
+            "session_summary": "",
+            "last_access": time.monotonic()
         }
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
         
-        print(f"🔄 Started new session: {session_id}")
+        logger.debug("Started new session: %s", session_id)
         return self.sessions[session_id]
     
     def add_exchange(self, session_id: str, user_input: str, emotion: str, 
@@ -51,40 +120,48 @@ class ConversationMemory:
             response: System response
             timestamp: Optional timestamp
         """
-        if session_id not in self.sessions:
-            self.start_session(session_id)
+        session = self._touch(session_id)
+        if session is None:
+            session = self.start_session(session_id)
         
         if timestamp is None:
-            timestamp = datetime.now().isoformat()
+            now = datetime.now()
+            timestamp = now.isoformat()
+        else:
+            now = datetime.fromisoformat(timestamp)
+        session["last_exchange_ts"] = now.timestamp()
         
         exchange = {
             "timestamp": timestamp,
             "user_input": user_input,
             "emotion": emotion,
             "response": response,
-            "exchange_id": len(self.sessions[session_id]["conversation_history"])
+            "exchange_id": len(session["conversation_history"])
         }
         
         # Add to conversation history
-        self.sessions[session_id]["conversation_history"].append(exchange)
-        
-        # Add to emotion history
-        self.sessions[session_id]["emotion_history"].append({
-            "timestamp": timestamp,
-            "emotion": emotion,
-            "confidence": 0.8  # Default confidence
-        })
+        session["conversation_history"].append(exchange)
+        
+        # Add to emotion history, dropping the oldest entry (and its count) once the window is full
+        emotion_ids = session["emotion_ids"]
+        emotion_counts = session["emotion_counts"]
+        if len(emotion_ids) >= self.max_emotion_history:
+            evicted = emotion_ids[0]
+            emotion_counts[evicted] -= 1
+            if not emotion_counts[evicted]:
+                del emotion_counts[evicted]
+            del emotion_ids[0], session["emotion_ts"][0], session["emotion_conf"][0]
+        emotion_id = EMOTION_IDS.get(emotion, OTHER_EMOTION_ID)
+        emotion_ids.append(emotion_id)
+        emotion_counts[emotion_id] += 1
+        session["emotion_ts"].append(session["last_exchange_ts"])
+        session["emotion_conf"].append(0.8)  # Default confidence
         
         # Extract topics from user input
-        topics = self._extract_topics(user_input)
-        self.sessions[session_id]["topics_discussed"].update(topics)
-        
-        # Keep only recent exchanges
-        if len(self.sessions[session_id]["conversation_history"]) > self.max_session_length:
-            self.sessions[session_id]["conversation_history"] = \
-                self.sessions[session_id]["conversation_history"][-self.max_session_length:]
+        topics = _extract_topics(user_input)
+        session["topics_discussed"].update(topics)
         
-        print(f"💬 Added exchange to session {session_id}: {emotion} -> {len(topics)} topics")
+        logger.debug("Added exchange to session %s: %s -> %d topics", session_id, emotion, len(topics))
     
     def get_session_context(self, session_id: str) -> Dict[str, Any]:
         """
@@ -96,16 +173,16 @@ class ConversationMemory:
         Returns:
             Session context information
         """
-        if session_id not in self.sessions:
+        session = self._touch(session_id)
+        if session is None:
             return {"error": "Session not found"}
         
-        session = self.sessions[session_id]
-        
         # Get recent conversation history
-        recent_history = session["conversation_history"][-5:]  # Last 5 exchanges
+        history = session["conversation_history"]
+        recent_history = list(islice(history, max(0, len(history) - 5), None))  # Last 5 exchanges
         
         # Get emotion trends
-        emotion_trends = self._analyze_emotion_trends(session["emotion_history"])
+        emotion_trends = self._analyze_emotion_trends(session)
         
         # Get session summary
         session_summary = self._generate_session_summary(session)
@@ -130,17 +207,16 @@ class ConversationMemory:
         Returns:
             Personalized context string
         """
-        if session_id not in self.sessions:
+        session = self._touch(session_id)
+        if session is None:
             return ""
         
-        session = self.sessions[session_id]
         context_parts = []
         
         # Add recent emotion context
-        if session["emotion_history"]:
-            recent_emotions = [e["emotion"] for e in session["emotion_history"][-3:]]
-            if recent_emotions:
-                context_parts.append(f"Recent emotions: {', '.join(recent_emotions)}")
+        if session["emotion_ids"]:
+            recent_emotions = [EMOTIONS[i] for i in session["emotion_ids"][-3:]]
+            context_parts.append(f"Recent emotions: {', '.join(recent_emotions)}")
         
         # Add topics context
         if session["topics_discussed"]:
@@ -154,45 +230,44 @@ class ConversationMemory:
         
         return " | ".join(context_parts) if context_parts else ""
     
-    def _extract_topics(self, text: str) -> List[str]:
-        """Extract topics from user input."""
-        topics = []
-        text_lower = text.lower()
-        
-        # Common therapeutic topics
-        topic_keywords = {
-            "anxiety": ["anxious", "worry", "nervous", "panic", "fear"],
-            "depression": ["sad", "depressed", "down", "hopeless", "blue"],
-            "stress": ["stressed", "overwhelmed", "pressure", "tension"],
-            "relationships": ["relationship", "partner", "family", "friend", "social"],
-            "work": ["work", "job", "career", "boss", "colleague"],
-            "health": ["health", "sick", "pain", "medical", "doctor"],
-            "sleep": ["sleep", "insomnia", "tired", "exhausted"],
-            "self-esteem": ["confidence", "self-worth", "value", "worthless"],
-            "trauma": ["trauma", "abuse", "ptsd", "flashback", "trigger"]
-        }
-        
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
-                topics.append(topic)
-        
-        return topics
+    def _touch(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a live session and mark it most recently used, or None if it is missing or has gone idle."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        
+        now = time.monotonic()
+        if now - session["last_access"] >= self.session_ttl_seconds:
+            del self.sessions[session_id]
+            return None
+        
+        session["last_access"] = now
+        self.sessions.move_to_end(session_id)
+        return session
+    
+    def _evict_idle_sessions(self) -> None:
+        """Drop idle sessions from the least recently used end until a live one is reached."""
+        cutoff = time.monotonic() - self.session_ttl_seconds
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if oldest["last_access"] > cutoff:
+                break
+            self.sessions.popitem(last=False)
     
-    def _analyze_emotion_trends(self, emotion_history: List[Dict]) -> Dict[str, Any]:
+    def _analyze_emotion_trends(self, session: Dict) -> Dict[str, Any]:
         """Analyze emotion trends in the session."""
-        if not emotion_history:
+        emotion_ids = session["emotion_ids"]
+        if not emotion_ids:
             return {"trend": "neutral", "stability": "unknown"}
         
-        emotions = [e["emotion"] for e in emotion_history]
-        
-        # Calculate emotion distribution
-        emotion_counts = {}
-        for emotion in emotions:
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        # The distribution is maintained incrementally by add_exchange
+        emotion_counts = session["emotion_counts"]
+        emotion_distribution = {EMOTIONS[emotion_id]: count for emotion_id, count in emotion_counts.items()}
+        dominant_emotion = EMOTIONS[emotion_counts.most_common(1)[0][0]]
         
         # Determine trend
-        if len(emotions) >= 3:
-            recent_emotions = emotions[-3:]
+        if len(emotion_ids) >= 3:
+            recent_emotions = [EMOTIONS[i] for i in emotion_ids[-3:]]
             if len(set(recent_emotions)) == 1:
                 trend = "stable"
             elif recent_emotions[-1] in ["happiness", "neutral"]:
@@ -204,9 +279,9 @@ class ConversationMemory:
         
         return {
             "trend": trend,
-            "dominant_emotion": max(emotion_counts, key=emotion_counts.get),
-            "emotion_distribution": emotion_counts,
-            "stability": "stable" if len(set(emotions)) <= 2 else "variable"
+            "dominant_emotion": dominant_emotion,
+            "emotion_distribution": emotion_distribution,
+            "stability": "stable" if len(emotion_distribution) <= 2 else "variable"
         }
     
     def _generate_session_summary(self, session: Dict) -> str:
@@ -222,8 +297,8 @@ class ConversationMemory:
         if topics:
             summary_parts.append(f"discussing {', '.join(topics[:3])}")
         
-        if session["emotion_history"]:
-            recent_emotion = session["emotion_history"][-1]["emotion"]
+        if session["emotion_ids"]:
+            recent_emotion = EMOTIONS[session["emotion_ids"][-1]]
             summary_parts.append(f"current emotion: {recent_emotion}")
         
         return " | ".join(summary_parts)
@@ -233,11 +308,7 @@ class ConversationMemory:
         if not session["conversation_history"]:
             return "0 minutes"
         
-        start_time = datetime.fromisoformat(session["start_time"])
-        end_time = datetime.fromisoformat(session["conversation_history"][-1]["timestamp"])
-        duration = end_time - start_time
-        
-        minutes = int(duration.total_seconds() / 60)
+        minutes = int((session["last_exchange_ts"] - session["start_ts"]) / 60)
         return f"{minutes} minutes"
     
     def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
@@ -250,10 +321,11 @@ class ConversationMemory:
         Returns:
             List of conversation exchanges
         """
-        if session_id not in self.sessions:
+        session = self._touch(session_id)
+        if session is None:
             return []
         
-        return self.sessions[session_id]["conversation_history"]
+        return list(session["conversation_history"])
 
 # Global conversation memory instance
 conversation_memory = ConversationMemory()
@@ -4,23 +4,189 @@ Handles all database operations with proper error handling and logging.
 """
 
 import logging
+import os
+import queue
+import threading
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
+from ..core.cache import TTLCache
 from ..models.database import (
-    DatabaseOperations, User, Session as TherapySession, 
-    Interaction, MoodEntry, SystemMetrics
+    DatabaseOperations, User, TherapySession, 
+    Interaction, MoodEntry, SystemMetrics, SessionLocal, after_commit, hash_audio,
+    PARTITION_TABLES, db_manager
 )
 
 logger = logging.getLogger(__name__)
 
+USER_PROFILE_CACHE_TTL_SECONDS = int(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", "30"))
+SYSTEM_HEALTH_CACHE_TTL_SECONDS = int(os.getenv("SYSTEM_HEALTH_CACHE_TTL_SECONDS", "10"))
+# The daily snapshot is backfilled this far at startup, which bounds the windows it can answer
+DAILY_STATS_BACKFILL_DAYS = int(os.getenv("DAILY_STATS_BACKFILL_DAYS", "90"))
+
+# Profiles change on the minute scale and health aggregates over every user, so both absorb request bursts
+user_profile_cache = TTLCache(max_size=1024, ttl_seconds=USER_PROFILE_CACHE_TTL_SECONDS)
+system_health_cache = TTLCache(max_size=16, ttl_seconds=SYSTEM_HEALTH_CACHE_TTL_SECONDS)
+
+class SystemMetricsWriter:
+    """Buffers system metrics rows and writes them in batches from a background thread.
+    
+    A batch is written every flush_interval seconds, or as soon as max_batch rows are waiting.
+    """
+    
+    def __init__(self, flush_interval: float = 1.0, max_batch: int = 1000):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._batch_ready = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def record(self, **metrics_data):
+        """Queue one metrics row; the timestamp is taken now, not when the batch is written."""
+        metrics_data.setdefault("timestamp", datetime.utcnow())
+        self._queue.put(metrics_data)
+        if self._thread is None:
+            self._start()
+        elif self._queue.qsize() >= self.max_batch:
+            # A full batch is waiting, so wake the writer instead of letting the queue grow until the next tick
+            self._batch_ready.set()
+    
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="system-metrics-writer", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._batch_ready.wait(self.flush_interval)
+            self._batch_ready.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+    
+    def flush(self) -> int:
+        """Write every queued row, max_batch rows per insert; returns the number written."""
+        written = 0
+        while True:
+            rows = []
+            try:
+                while len(rows) < self.max_batch:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not rows:
+                return written
+            
+            db = SessionLocal()
+            try:
+                written += DatabaseOperations(db).bulk_create_metrics(rows)
+            except SQLAlchemyError as e:
+                logger.error(f"Error writing {len(rows)} system metrics: {e}")
+                db.rollback()
+            finally:
+                db.close()
+    
+    def stop(self):
+        """Stop the background thread and write whatever is still queued."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        self._stopped.set()
+        self._batch_ready.set()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+# Shared writer so request handlers only pay for a queue put
+metrics_writer = SystemMetricsWriter()
+
+class DailyStatsRefresher:
+    """Keeps the daily_user_stats snapshot current from a background thread."""
+    
+    def __init__(self, refresh_interval: float = 900.0, backfill_days: int = DAILY_STATS_BACKFILL_DAYS):
+        self.refresh_interval = refresh_interval
+        self.backfill_days = backfill_days
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def start(self):
+        """Backfill the snapshot, then refresh it every refresh_interval seconds."""
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="daily-stats-refresher", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        self.roll_partitions()
+        self.refresh(days=self.backfill_days)
+        while not self._stopped.wait(self.refresh_interval):
+            self.roll_partitions()
+            # Yesterday is included so sessions that end after midnight get their final duration
+            self.refresh(days=2)
+    
+    def roll_partitions(self):
+        """Keep the upcoming monthly partitions created ahead of the rows that will land in them."""
+        if not PARTITION_TABLES:
+            return
+        try:
+            db_manager.create_partitions()
+        except SQLAlchemyError as e:
+            logger.error(f"Error creating monthly partitions: {e}")
+    
+    def refresh(self, days: int = 2) -> int:
+        """Rebuild the snapshot for the last days UTC days, today included; returns the rows written."""
+        # Raw timestamps are naive UTC, so the snapshot's days are UTC days too
+        today = datetime.utcnow().date()
+        written = 0
+        db = SessionLocal()
+        try:
+            ops = DatabaseOperations(db)
+            for offset in range(days):
+                # A long backfill must not hold up shutdown
+                if self._stopped.is_set():
+                    break
+                written += ops.refresh_daily_stats(today - timedelta(days=offset))
+        except SQLAlchemyError as e:
+            logger.error(f"Error refreshing daily user stats: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        return written
+    
+    def stop(self):
+        """Stop the background thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        self._stopped.set()
+        if thread is not None:
+            thread.join()
+
+daily_stats_refresher = DailyStatsRefresher()
+
 class DatabaseService:
     """Service class for database operations."""
     
-    def __init__(self, db: Session):
+    __slots__ = ("db", "ops")
+    
+    def __init__(self, db: Session, autocommit: bool = True):
         self.db = db
-        self.ops = DatabaseOperations(db)
+        self.ops = DatabaseOperations(db, autocommit=autocommit)
+    
+    def commit(self) -> bool:
+        """Commit the unit of work started with autocommit=False."""
+        try:
+            self.db.commit()
+            return True
+        except SQLAlchemyError as e:
+            logger.error(f"Error committing database transaction: {e}")
+            self.db.rollback()
+            return False
     
     # User management
     def create_or_get_user(self, username: str, email: Optional[str] = None) -> User:
@@ -43,16 +209,20 @@ class DatabaseService:
     
     def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user profile with statistics."""
+        cached = user_profile_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
         try:
             user = self.ops.get_user(user_id)
             if not user:
                 return None
             
             # Get user statistics
-            sessions = self.ops.get_user_sessions(user_id, limit=100)
-            mood_history = self.ops.get_user_mood_history(user_id, days=30)
+            session_count, last_session = self.ops.get_user_session_stats(user_id)
+            mood_entry_count = self.ops.count_user_mood_entries(user_id, days=30)
             
-            return {
+            profile = {
                 "user": {
                     "id": str(user.id),
                     "username": user.username,
@@ -61,11 +231,13 @@ class DatabaseService:
                     "is_active": user.is_active
                 },
                 "statistics": {
-                    "total_sessions": len(sessions),
-                    "total_mood_entries": len(mood_history),
-                    "last_session": sessions[0].started_at.isoformat() if sessions else None
+                    "total_sessions": session_count,
+                    "total_mood_entries": mood_entry_count,
+                    "last_session": last_session.isoformat() if last_session else None
                 }
             }
+            user_profile_cache.set(user_id, profile)
+            return profile
             
         except SQLAlchemyError as e:
             logger.error(f"Error getting user profile {user_id}: {e}")
@@ -76,6 +248,8 @@ class DatabaseService:
         """Start a new therapy session."""
         try:
             session = self.ops.create_session(user_id, session_type)
+            # Dropped once the session row is committed, so a read in between can't re-cache the old stats
+            after_commit(self.db, lambda: user_profile_cache.pop(user_id))
             logger.info(f"Started new session {session.id} for user {user_id}")
             
             return {
@@ -98,14 +272,15 @@ class DatabaseService:
                 logger.warning(f"Session {session_id} not found")
                 return False
             
-            # Calculate duration
-            duration = datetime.utcnow() - session.started_at
+            # Calculate duration against the same instant that is stored as ended_at
+            ended_at = datetime.utcnow()
+            duration = ended_at - session.started_at
             duration_minutes = int(duration.total_seconds() / 60)
             
             # Update session
             updated_session = self.ops.update_session(
                 session_id,
-                ended_at=datetime.utcnow(),
+                ended_at=ended_at,
                 duration_minutes=duration_minutes,
                 status="completed"
             )
@@ -129,15 +304,8 @@ class DatabaseService:
             
             interactions = self.ops.get_session_interactions(session_id)
             
-            # Calculate session statistics
-            emotions = [i.detected_emotion for i in interactions if i.detected_emotion]
-            emotion_counts = {}
-            for emotion in emotions:
-                emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-            
-            # Calculate average confidence
-            confidences = [i.emotion_confidence for i in interactions if i.emotion_confidence]
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            # Session statistics are aggregated by the database
+            statistics = self.ops.get_session_stats(session_id)
             
             return {
                 "session": {
@@ -150,21 +318,17 @@ class DatabaseService:
                 },
                 "interactions": [
                     {
-                        "id": str(i.id),
-                        "timestamp": i.timestamp.isoformat(),
-                        "transcribed_text": i.transcribed_text,
-                        "detected_emotion": i.detected_emotion,
-                        "emotion_confidence": i.emotion_confidence,
-                        "therapeutic_response": i.therapeutic_response
+                        "id": str(interaction_id),
+                        "timestamp": timestamp.isoformat(),
+                        "transcribed_text": transcribed_text,
+                        "detected_emotion": detected_emotion,
+                        "emotion_confidence": emotion_confidence,
+                        "therapeutic_response": therapeutic_response
                     }
-                    for i in interactions
+                    for interaction_id, timestamp, transcribed_text, detected_emotion,
+                        emotion_confidence, therapeutic_response in interactions
                 ],
-                "statistics": {
-                    "total_interactions": len(interactions),
-                    "emotion_distribution": emotion_counts,
-                    "average_confidence": avg_confidence,
-                    "processing_errors": len([i for i in interactions if i.error_message])
-                }
+                "statistics": statistics
             }
             
         except SQLAlchemyError as e:
@@ -172,9 +336,14 @@ class DatabaseService:
             return None
     
     # Interaction logging
-    def log_interaction(self, session_id: str, user_id: str, **interaction_data) -> Optional[Dict[str, Any]]:
-        """Log a new interaction."""
+    def log_interaction(self, session_id: str, user_id: str, audio_data: Optional[bytes] = None,
+                        **interaction_data) -> Optional[Dict[str, Any]]:
+        """Log a new interaction; raw audio_data is stored only as its hash (or pass audio_data_hash)."""
         try:
+            if audio_data is not None:
+                interaction_data["audio_data_hash"] = hash_audio(audio_data)
+            
+            # Every exchange gets its own row, even for repeated audio; only the analysis is reused
             interaction = self.ops.create_interaction(session_id, user_id, **interaction_data)
             logger.info(f"Logged interaction {interaction.id} for session {session_id}")
             
@@ -189,6 +358,24 @@ class DatabaseService:
             logger.error(f"Error logging interaction for session {session_id}: {e}")
             return None
     
+    def get_interaction_by_audio_hash(self, user_id: str, audio_data_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the transcript and emotion already analysed for a user's audio, if any."""
+        try:
+            interaction = self.ops.get_interaction_by_audio_hash(user_id, audio_data_hash)
+            if not interaction or not interaction.transcribed_text or not interaction.detected_emotion:
+                return None
+            
+            return {
+                "interaction_id": str(interaction.id),
+                "transcribed_text": interaction.transcribed_text,
+                "detected_emotion": interaction.detected_emotion,
+                "confidence": interaction.emotion_confidence
+            }
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Error looking up audio for user {user_id}: {e}")
+            return None
+    
     # Mood tracking
     def log_mood_entry(self, user_id: str, emotion: str, intensity: int, **mood_data) -> Optional[Dict[str, Any]]:
         """Log a mood entry."""
@@ -199,6 +386,7 @@ class DatabaseService:
                 intensity = max(1, min(10, intensity))  # Clamp to valid range
             
             mood_entry = self.ops.create_mood_entry(user_id, emotion, intensity, **mood_data)
+            after_commit(self.db, lambda: user_profile_cache.pop(user_id))
             logger.info(f"Logged mood entry {mood_entry.id} for user {user_id}")
             
             return {
@@ -215,45 +403,39 @@ class DatabaseService:
     def get_mood_analytics(self, user_id: str, days: int = 30) -> Dict[str, Any]:
         """Get comprehensive mood analytics for a user."""
         try:
-            trends_data = self.ops.get_mood_trends(user_id, days)
+            summary = self.ops.get_mood_summary(user_id, days)
             
-            if not trends_data["trends"]:
+            if not summary["total_entries"]:
                 return {
                     "message": "No mood data available",
                     "trends": [],
                     "analytics": {}
                 }
             
-            # Calculate additional analytics
-            mood_history = trends_data["trends"]
-            intensities = [entry.intensity for entry in mood_history]
-            emotions = [entry.emotion for entry in mood_history]
-            
-            # Time-based analysis
-            recent_week = [entry for entry in mood_history 
-                          if entry.timestamp >= datetime.utcnow() - timedelta(days=7)]
+            distribution = summary["emotion_distribution"]
             
             # Emotion trends over time
-            emotion_timeline = []
-            for entry in mood_history[-10:]:  # Last 10 entries
-                emotion_timeline.append({
-                    "date": entry.timestamp.isoformat(),
-                    "emotion": entry.emotion,
-                    "intensity": entry.intensity
-                })
+            emotion_timeline = [
+                {
+                    "date": timestamp.isoformat(),
+                    "emotion": emotion,
+                    "intensity": intensity
+                }
+                for timestamp, emotion, intensity in summary["timeline"]
+            ]
             
             return {
                 "trends": emotion_timeline,
                 "analytics": {
-                    "total_entries": len(mood_history),
-                    "average_intensity": trends_data["average_intensity"],
-                    "emotion_distribution": trends_data["emotion_distribution"],
-                    "recent_week_entries": len(recent_week),
-                    "most_common_emotion": max(trends_data["emotion_distribution"].items(), 
-                                             key=lambda x: x[1])[0] if trends_data["emotion_distribution"] else None,
+                    "total_entries": summary["total_entries"],
+                    "average_intensity": summary["average_intensity"],
+                    "emotion_distribution": distribution,
+                    "recent_week_entries": summary["recent_week_entries"],
+                    "most_common_emotion": max(distribution.items(), 
+                                             key=lambda x: x[1])[0] if distribution else None,
                     "intensity_range": {
-                        "min": min(intensities),
-                        "max": max(intensities)
+                        "min": summary["min_intensity"],
+                        "max": summary["max_intensity"]
                     }
                 }
             }
@@ -264,30 +446,48 @@ class DatabaseService:
     
     # System metrics
     def log_system_metrics(self, **metrics_data) -> bool:
-        """Log system performance metrics."""
+        """Queue system performance metrics for the background batch writer."""
+        metrics_writer.record(**metrics_data)
+        return True
+    
+    def log_system_metrics_batch(self, metrics: List[Dict[str, Any]]) -> bool:
+        """Log several system metrics entries in one batched insert."""
         try:
-            self.ops.create_system_metric(**metrics_data)
+            self.ops.bulk_create_metrics(metrics)
             return True
         except SQLAlchemyError as e:
-            logger.error(f"Error logging system metrics: {e}")
+            logger.error(f"Error logging {len(metrics)} system metrics: {e}")
             return False
     
     def get_system_health(self, hours: int = 24) -> Dict[str, Any]:
         """Get system health metrics."""
+        cached = system_health_cache.get(hours)
+        if cached is not None:
+            return cached
+        
         try:
-            metrics = self.ops.get_recent_metrics(hours)
-            
-            if not metrics:
+            # Metrics are streamed and folded into running totals, so only one batch is held at a time
+            data_points = 0
+            response_time_sum = response_time_count = 0
+            memory_sum = memory_count = 0
+            total_errors = 0
+            for m in self.ops.iter_recent_metrics(hours):
+                data_points += 1
+                if m.response_time_ms:
+                    response_time_sum += m.response_time_ms
+                    response_time_count += 1
+                if m.memory_usage_mb:
+                    memory_sum += m.memory_usage_mb
+                    memory_count += 1
+                if m.error_count:
+                    total_errors += m.error_count
+            
+            if not data_points:
                 return {"status": "no_data", "message": "No metrics available"}
             
             # Calculate averages
-            response_times = [m.response_time_ms for m in metrics if m.response_time_ms]
-            memory_usage = [m.memory_usage_mb for m in metrics if m.memory_usage_mb]
-            error_counts = [m.error_count for m in metrics if m.error_count]
-            
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-            avg_memory = sum(memory_usage) / len(memory_usage) if memory_usage else 0
-            total_errors = sum(error_counts)
+            avg_response_time = response_time_sum / response_time_count if response_time_count else 0
+            avg_memory = memory_sum / memory_count if memory_count else 0
             
             # Determine health status
             health_status = "healthy"
@@ -296,16 +496,18 @@ class DatabaseService:
             if total_errors > 10:
                 health_status = "unhealthy"
             
-            return {
+            health = {
                 "status": health_status,
                 "metrics": {
                     "average_response_time_ms": avg_response_time,
                     "average_memory_usage_mb": avg_memory,
                     "total_errors": total_errors,
-                    "data_points": len(metrics)
+                    "data_points": data_points
                 },
                 "timestamp": datetime.utcnow().isoformat()
             }
+            system_health_cache.set(hours, health)
+            return health
             
         except SQLAlchemyError as e:
             logger.error(f"Error getting system health: {e}")
@@ -4,13 +4,16 @@ This service provides both simple and advanced emotion detection.
 """
 
 import os
+import asyncio
 import torch
 import torch.nn as nn
 import numpy as np
-import librosa
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, List
 import pickle
 import logging
+import soundfile as sf
+
+from .audio_processor import audio_processor
 
 # Import our enhanced emotion detection modules
 from .emotion_detector_enhanced import HybridEmotionDetector, detect_emotion_hybrid
@@ -20,7 +23,11 @@ logger = logging.getLogger(__name__)
 
 class EmotionModel(nn.Module):
     """
-    Simple CNN model for emotion recognition (matching the training script).
+    Simple CNN model for emotion recognition.
+    
+    fc1 takes globally pooled conv features, so checkpoints saved from the older
+    flatten-based architecture (fc1 of 128*2000 inputs) no longer load and the
+    model has to be retrained with this layout.
     """
     
     def __init__(self, num_classes=9):
@@ -33,9 +40,11 @@ class EmotionModel(nn.Module):
         
         # Pooling
         self.pool = nn.MaxPool1d(2)
+        # Global average pooling over time, so fc1 sees 128 features instead of a 128*2000 flatten
+        self.gap = nn.AdaptiveAvgPool1d(1)
         
         # Fully connected layers
-        self.fc1 = nn.Linear(128 * 2000, 256)  # Adjusted for max_length=16000
+        self.fc1 = nn.Linear(128, 256)
         self.fc2 = nn.Linear(256, 128)
         self.fc3 = nn.Linear(128, num_classes)
         
@@ -54,8 +63,8 @@ class EmotionModel(nn.Module):
         x = self.pool(self.relu(self.conv2(x)))
         x = self.pool(self.relu(self.conv3(x)))
         
-        # Flatten
-        x = x.view(x.size(0), -1)
+        # Pool over time
+        x = self.gap(x).squeeze(-1)
         
         # Fully connected layers
         x = self.dropout(self.relu(self.fc1(x)))
@@ -74,11 +83,23 @@ class EmotionDetector:
         self.model = None
         self.label_encoder = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # Half precision on GPU (bfloat16 where the hardware supports it); CPU stays in float32
+        if self.device.type == 'cuda':
+            self.dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        else:
+            self.dtype = torch.float32
         self.emotion_labels = [
             "neutral", "happiness", "sadness", "anger", 
             "surprise", "frustration", "fear", "disgust", "excitement"
         ]
         
+        # Micro-batching: concurrent async requests arriving within max_wait_ms share one forward pass
+        self.max_batch = 16
+        self.max_wait_ms = 10
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_worker: Optional[asyncio.Task] = None
+        self._batch_loop: Optional[asyncio.AbstractEventLoop] = None
+        
     def load_model(self) -> bool:
         """
         Load the trained emotion detection model.
@@ -88,20 +109,24 @@ class EmotionDetector:
         """
         try:
             if not os.path.exists(self.model_path):
-                print(f"Model file not found: {self.model_path}")
+                logger.warning("Model file not found: %s", self.model_path)
                 return False
             
             # Load the model
             self.model = EmotionModel(num_classes=len(self.emotion_labels))
             self.model.load_state_dict(torch.load(self.model_path, map_location=self.device))
-            self.model.to(self.device)
+            self.model.to(device=self.device, dtype=self.dtype)
             self.model.eval()
+            self.model.requires_grad_(False)
+            if self.device.type == 'cuda':
+                # Inputs are always padded to the same length, so the autotuned conv kernels stay valid
+                torch.backends.cudnn.benchmark = True
             
-            print(f"Emotion detection model loaded successfully from {self.model_path}")
+            logger.info("Emotion detection model loaded successfully from %s", self.model_path)
             return True
             
         except Exception as e:
-            print(f"Error loading emotion model: {e}")
+            logger.error("Error loading emotion model: %s", e)
             self.model = None
             return False
     
@@ -131,7 +156,7 @@ class EmotionDetector:
             return audio_tensor
             
         except Exception as e:
-            print(f"Error preprocessing audio: {e}")
+            logger.error("Error preprocessing audio: %s", e)
             raise
     
     def detect_emotion(self, audio: np.ndarray, sample_rate: int = 16000) -> Dict[str, Any]:
@@ -155,35 +180,165 @@ class EmotionDetector:
                 }
         
         try:
-            # Preprocess audio
+            # Preprocess audio and get prediction
             audio_tensor = self.preprocess_audio(audio, sample_rate)
-            audio_tensor = audio_tensor.to(self.device)
-            
-            # Get prediction
-            with torch.no_grad():
-                outputs = self.model(audio_tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-                confidence, predicted = torch.max(probabilities, 1)
-                
-                emotion_idx = predicted.item()
-                confidence_score = confidence.item()
-                emotion = self.emotion_labels[emotion_idx]
+            return self._predict_batch(audio_tensor)[0]
             
+        except Exception as e:
+            logger.error("Error detecting emotion: %s", e)
             return {
-                "emotion": emotion,
+                "emotion": "neutral",
+                "confidence": 0.0,
+                "error": str(e)
+            }
+    
+    def _predict_batch(self, audio_batch: torch.Tensor) -> List[Dict[str, Any]]:
+        """
+        Run one forward pass over a batch of preprocessed audio.
+        
+        Args:
+            audio_batch: Tensor of shape (batch_size, max_length)
+            
+        Returns:
+            One emotion detection result per row of the batch
+        """
+        with torch.inference_mode():
+            outputs = self.model(audio_batch.to(self.device, dtype=self.dtype))
+            # Softmax in float32 so half-precision logits don't lose the confidence resolution
+            probabilities = torch.softmax(outputs.float(), dim=1)
+            confidence, predicted = torch.max(probabilities, 1)
+        
+        # A single device-to-host copy for the whole batch
+        probabilities = probabilities.cpu().numpy()
+        return [
+            {
+                "emotion": self.emotion_labels[emotion_idx],
                 "confidence": confidence_score,
-                "probabilities": probabilities.cpu().numpy()[0].tolist(),
+                "probabilities": row.tolist(),
                 "error": None
             }
+            for emotion_idx, confidence_score, row in zip(
+                predicted.tolist(), confidence.tolist(), probabilities
+            )
+        ]
+    
+    async def detect_emotion_async(self, audio: np.ndarray, sample_rate: int = 16000) -> Dict[str, Any]:
+        """
+        Detect emotion from audio, batched with other concurrent requests.
+        
+        Args:
+            audio: Audio array
+            sample_rate: Sample rate of the audio
             
+        Returns:
+            Dictionary with emotion detection results
+        """
+        # Loading the weights and preprocessing are blocking work, kept off the event loop
+        if self.model is None:
+            if not await asyncio.to_thread(self.load_model):
+                return {
+                    "emotion": "neutral",
+                    "confidence": 0.0,
+                    "error": "Model not loaded - using fallback"
+                }
+        
+        try:
+            audio_tensor = await asyncio.to_thread(self.preprocess_audio, audio, sample_rate)
+        except Exception as e:
+            return {
+                "emotion": "neutral",
+                "confidence": 0.0,
+                "error": str(e)
+            }
+        
+        loop = asyncio.get_running_loop()
+        if self._batch_worker is None or self._batch_worker.done() or self._batch_loop is not loop:
+            self._batch_queue = asyncio.Queue()
+            self._batch_loop = loop
+            self._batch_worker = loop.create_task(self._run_batches(self._batch_queue))
+        
+        future = loop.create_future()
+        await self._batch_queue.put((audio_tensor, future))
+        try:
+            return await future
         except Exception as e:
-            print(f"Error detecting emotion: {e}")
+            logger.error("Error detecting emotion: %s", e)
             return {
                 "emotion": "neutral",
                 "confidence": 0.0,
                 "error": str(e)
             }
     
+    async def stop_batching(self) -> None:
+        """Cancel the batching worker; callers still waiting get the fallback result."""
+        worker, self._batch_worker = self._batch_worker, None
+        if worker is None or worker.done():
+            return
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+    
+    async def _run_batches(self, queue: asyncio.Queue) -> None:
+        """Collect queued requests into batches of up to max_batch and resolve each caller's future."""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await queue.get()]
+                
+                # Give concurrent requests up to max_wait_ms to join the batch
+                deadline = loop.time() + self.max_wait_ms / 1000
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                
+                # A failure anywhere in the batch is handed to every caller in it, so the worker
+                # keeps running and nobody is left waiting on a future that never resolves
+                try:
+                    # preprocess_audio pads every clip to the same length, so the rows stack directly
+                    audio_batch = torch.cat([audio_tensor for audio_tensor, _ in batch])
+                    results = await asyncio.to_thread(self._predict_batch, audio_batch)
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, future), result in zip(batch, results):
+                    # Callers that went away (e.g. a cancelled request) leave a done future behind
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Stopped: release the batch in flight and everything still queued
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Emotion detection stopped"))
+    
+    def _load_base64_audio(self, base64_audio: str) -> Tuple[np.ndarray, int]:
+        """Decode base64 audio into a 16kHz array, in memory where libsndfile can read the format."""
+        # Decode base64 audio
+        audio_bytes = audio_processor.decode_base64_audio(base64_audio)
+        
+        # Load audio straight from memory at 16kHz; only formats libsndfile
+        # can't decode take the temporary file round-trip through librosa
+        try:
+            return audio_processor.load_audio_bytes(audio_bytes)
+        except sf.LibsndfileError:
+            temp_path = audio_processor.save_audio_to_temp_file(audio_bytes)
+            try:
+                return audio_processor.load_audio_file(temp_path)
+            finally:
+                audio_processor.cleanup_temp_file(temp_path)
+    
     def detect_emotion_from_base64(self, base64_audio: str) -> Dict[str, Any]:
         """
         Detect emotion from base64 encoded audio.
@@ -195,32 +350,41 @@ class EmotionDetector:
             Dictionary with emotion detection results
         """
         try:
-            # Decode base64 audio
-            import base64
-            audio_bytes = base64.b64decode(base64_audio)
-            
-            # Save to temporary file
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_bytes)
-                temp_path = temp_file.name
-            
-            # Load audio
-            audio, sample_rate = librosa.load(temp_path, sr=16000)
-            
-            # Clean up temporary file
-            os.unlink(temp_path)
+            audio, sample_rate = self._load_base64_audio(base64_audio)
             
             # Detect emotion
             return self.detect_emotion(audio, sample_rate)
             
         except Exception as e:
-            print(f"Error processing base64 audio: {e}")
+            logger.error("Error processing base64 audio: %s", e)
             return {
                 "emotion": "neutral",
                 "confidence": 0.0,
                 "error": str(e)
             }
+    
+    async def detect_emotion_from_base64_async(self, base64_audio: str) -> Dict[str, Any]:
+        """
+        Detect emotion from base64 encoded audio through the micro-batching queue.
+        
+        Args:
+            base64_audio: Base64 encoded audio string
+            
+        Returns:
+            Dictionary with emotion detection results
+        """
+        try:
+            # Decoding and resampling block, so they run in the default executor
+            audio, sample_rate = await asyncio.to_thread(self._load_base64_audio, base64_audio)
+        except Exception as e:
+            logger.error("Error processing base64 audio: %s", e)
+            return {
+                "emotion": "neutral",
+                "confidence": 0.0,
+                "error": str(e)
+            }
+        
+        return await self.detect_emotion_async(audio, sample_rate)
 
 # Global instance
 emotion_detector = EmotionDetector()
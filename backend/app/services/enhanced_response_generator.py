@@ -27,6 +27,7 @@ class EnhancedResponseGenerator:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
         
         openai.api_key = self.openai_api_key
+        self._openai_client = None
         
         # CBT-specific response templates
         self.cbt_techniques = {
@@ -187,6 +188,13 @@ class EnhancedResponseGenerator:
         
         return "\n".join(context_parts)
     
+    def _get_openai_client(self, api_key: str):
+        """Reuse one OpenAI client, and its connection pool, for as long as the key stays the same."""
+        if self._openai_client is None or self._openai_client.api_key != api_key:
+            from openai import OpenAI
+            self._openai_client = OpenAI(api_key=api_key)
+        return self._openai_client
+    
     def _generate_ai_response(self, context: str, emotion_config: Dict[str, Any]) -> str:
         """Generate AI response using Gemini API (free) or OpenAI as fallback."""
         
@@ -214,8 +222,7 @@ class EnhancedResponseGenerator:
         openai_key = os.getenv("OPENAI_API_KEY")
         if openai_key and openai_key != "your_new_openai_api_key_here":
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=openai_key)
+                client = self._get_openai_client(openai_key)
                 
                 response = client.chat.completions.create(
                     model="gpt-3.5-turbo",
@@ -29,6 +29,9 @@ class EnhancedTTSService:
             "pitch": 1.0   # Pitch level (0.5 to 2.0)
         }
         
+        # Output directories already created, so later syntheses skip the filesystem check
+        self._output_dirs = set()
+        
         # Initialize TTS engine
         self._initialize_engine()
         
@@ -236,8 +239,11 @@ class EnhancedTTSService:
             raise RuntimeError("TTS engine not available")
             
         try:
-            # Create output directory if it doesn't exist
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            # Create output directory if it doesn't exist, once per directory
+            output_dir = os.path.dirname(output_file)
+            if output_dir and output_dir not in self._output_dirs:
+                os.makedirs(output_dir, exist_ok=True)
+                self._output_dirs.add(output_dir)
             
             # Save current settings
             original_rate = self.engine.getProperty('rate')
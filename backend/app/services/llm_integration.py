@@ -25,6 +25,17 @@ class LLMIntegration:
         self.local_llm_url = os.getenv("LOCAL_LLM_URL", "http://localhost:11434")
         self.fallback_enabled = True
         
+        # Long-lived clients keep their HTTP connections alive between requests
+        self._openai_client = None
+        self._http = requests.Session()
+    
+    def _get_openai_client(self):
+        """Create the OpenAI client on first use and reuse it, with its connection pool, afterwards."""
+        if self._openai_client is None:
+            from openai import OpenAI
+            self._openai_client = OpenAI(api_key=self.openai_api_key)
+        return self._openai_client
+        
     def generate_response(self, 
                         user_message: str, 
                         emotion: str, 
@@ -83,8 +94,7 @@ class LLMIntegration:
         )
         
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_api_key)
+            client = self._get_openai_client()
             
             response = client.chat.completions.create(
                 model=self.openai_model,
@@ -116,7 +126,7 @@ class LLMIntegration:
         )
         
         try:
-            response = requests.post(
+            response = self._http.post(
                 f"{self.local_llm_url}/api/generate",
                 json={
                     "model": "llama2",  # or other local model
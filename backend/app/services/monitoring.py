@@ -3,6 +3,7 @@ Comprehensive monitoring and analytics service for Voice CBT application.
 """
 
 import time
+import numpy as np
 import psutil
 import logging
 import asyncio
@@ -363,35 +364,40 @@ class MonitoringService:
         system_metrics = [m["system"] for m in recent_metrics]
         app_metrics = [m["application"] for m in recent_metrics]
         
-        # System metrics summary
-        cpu_values = [m["cpu_percent"] for m in system_metrics]
-        memory_values = [m["memory_percent"] for m in system_metrics]
-        response_times = [m["response_time_ms"] for m in system_metrics]
+        # System metrics summary; one pass into arrays, then C-level reductions
+        count = len(system_metrics)
+        cpu_values = np.fromiter((m["cpu_percent"] for m in system_metrics), dtype=np.float64, count=count)
+        memory_values = np.fromiter((m["memory_percent"] for m in system_metrics), dtype=np.float64, count=count)
+        response_times = np.fromiter((m["response_time_ms"] for m in system_metrics), dtype=np.float64, count=count)
         
         # Application metrics summary
-        total_sessions = sum(m["active_sessions"] for m in app_metrics)
-        total_interactions = sum(m["total_interactions"] for m in app_metrics)
-        successful_interactions = sum(m["successful_interactions"] for m in app_metrics)
-        failed_interactions = sum(m["failed_interactions"] for m in app_metrics)
+        app_totals = np.array(
+            [
+                (m["active_sessions"], m["total_interactions"], m["successful_interactions"], m["failed_interactions"])
+                for m in app_metrics
+            ],
+            dtype=np.int64
+        ).sum(axis=0)
+        total_sessions, total_interactions, successful_interactions, failed_interactions = (int(t) for t in app_totals)
         
         return {
             "period_hours": hours,
             "data_points": len(recent_metrics),
             "system": {
                 "cpu": {
-                    "average": sum(cpu_values) / len(cpu_values),
-                    "max": max(cpu_values),
-                    "min": min(cpu_values)
+                    "average": float(cpu_values.mean()),
+                    "max": float(cpu_values.max()),
+                    "min": float(cpu_values.min())
                 },
                 "memory": {
-                    "average": sum(memory_values) / len(memory_values),
-                    "max": max(memory_values),
-                    "min": min(memory_values)
+                    "average": float(memory_values.mean()),
+                    "max": float(memory_values.max()),
+                    "min": float(memory_values.min())
                 },
                 "response_time": {
-                    "average": sum(response_times) / len(response_times) if response_times else 0,
-                    "max": max(response_times) if response_times else 0,
-                    "min": min(response_times) if response_times else 0
+                    "average": float(response_times.mean()),
+                    "max": float(response_times.max()),
+                    "min": float(response_times.min())
                 }
             },
             "application": {
@@ -6,6 +6,10 @@ from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import json
 import statistics
+import numpy as np
+
+# Fitted change in mood score over a series that counts as a trend rather than noise
+TREND_THRESHOLD = 0.1
 
 class ProgressTracker:
     """
@@ -170,37 +174,36 @@ class ProgressTracker:
         if not recent_moods:
             return {"error": "No recent mood data"}
         
-        # Analyze mood patterns
-        emotion_counts = {}
-        mood_scores = []
-        daily_averages = {}
-        
-        for mood in recent_moods:
-            emotion = mood["emotion"]
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-            mood_scores.append(mood["mood_score"])
-            
-            # Group by day
-            date = mood["timestamp"][:10]
-            if date not in daily_averages:
-                daily_averages[date] = []
-            daily_averages[date].append(mood["mood_score"])
-        
-        # Calculate daily averages
+        # Analyze mood patterns: emotions and days are coded to integers and histogrammed with bincount
+        scores = np.fromiter((m["mood_score"] for m in recent_moods), dtype=np.float64, count=len(recent_moods))
+        emotions, emotion_first, emotion_codes = np.unique(
+            [m["emotion"] for m in recent_moods], return_index=True, return_inverse=True
+        )
+        emotion_totals = np.bincount(emotion_codes, minlength=len(emotions))
+        
+        days_seen, day_first, day_codes = np.unique(
+            [m["timestamp"][:10] for m in recent_moods], return_index=True, return_inverse=True
+        )
+        day_sums = np.bincount(day_codes, weights=scores, minlength=len(days_seen))
+        day_counts = np.bincount(day_codes, minlength=len(days_seen))
+        
+        # Report in order of first appearance, which also breaks ties for the most common emotion
+        emotion_order = np.argsort(emotion_first)
+        emotion_counts = {str(emotions[i]): int(emotion_totals[i]) for i in emotion_order}
         daily_trends = {
-            date: statistics.mean(scores) 
-            for date, scores in daily_averages.items()
+            str(days_seen[i]): float(day_sums[i] / day_counts[i])
+            for i in np.argsort(day_first)
         }
         
         return {
             "period_days": days,
             "total_entries": len(recent_moods),
             "emotion_distribution": emotion_counts,
-            "average_mood_score": statistics.mean(mood_scores),
-            "mood_score_trend": self._calculate_trend(mood_scores),
+            "average_mood_score": float(scores.mean()),
+            "mood_score_trend": self._calculate_trend(scores),
             "daily_averages": daily_trends,
-            "most_common_emotion": max(emotion_counts, key=emotion_counts.get),
-            "mood_stability": self._calculate_mood_stability(mood_scores)
+            "most_common_emotion": str(emotions[emotion_order[emotion_totals[emotion_order].argmax()]]),
+            "mood_stability": self._calculate_mood_stability(scores)
         }
     
     def _emotion_to_score(self, emotion: str, confidence: float) -> float:
@@ -243,14 +246,14 @@ class ProgressTracker:
         if not mood_data:
             return {"trend": "insufficient_data"}
         
-        scores = [m["mood_score"] for m in mood_data]
-        emotions = [m["emotion"] for m in mood_data]
+        scores = np.fromiter((m["mood_score"] for m in mood_data), dtype=np.float64, count=len(mood_data))
+        emotions, emotion_counts = np.unique([m["emotion"] for m in mood_data], return_counts=True)
         
         return {
             "trend": self._calculate_trend(scores),
-            "average_score": statistics.mean(scores),
-            "score_range": [min(scores), max(scores)],
-            "most_common_emotion": max(set(emotions), key=emotions.count),
+            "average_score": float(scores.mean()),
+            "score_range": [float(scores.min()), float(scores.max())],
+            "most_common_emotion": str(emotions[emotion_counts.argmax()]),
             "stability": self._calculate_mood_stability(scores)
         }
     
@@ -283,12 +286,18 @@ class ProgressTracker:
         if len(scores) < 3:
             return "insufficient_data"
         
-        recent_avg = statistics.mean(scores[-3:])
-        earlier_avg = statistics.mean(scores[:-3]) if len(scores) > 3 else recent_avg
+        scores = np.asarray(scores, dtype=np.float64)
+        # Smooth with a 3-point moving average once there are enough points to keep a slope
+        if len(scores) >= 5:
+            scores = np.convolve(scores, np.ones(3) / 3, mode="valid")
+        
+        # Least-squares slope, scaled to the change it predicts across the whole series
+        slope = np.polyfit(np.arange(len(scores), dtype=np.float64), scores, 1)[0]
+        change = slope * (len(scores) - 1)
         
-        if recent_avg > earlier_avg + 0.1:
+        if change > TREND_THRESHOLD:
             return "improving"
-        elif recent_avg < earlier_avg - 0.1:
+        elif change < -TREND_THRESHOLD:
             return "declining"
         else:
             return "stable"
@@ -298,7 +307,8 @@ class ProgressTracker:
         if len(scores) < 3:
             return "insufficient_data"
         
-        variance = statistics.variance(scores)
+        # Sample variance, as statistics.variance computes it
+        variance = np.var(scores, ddof=1)
         if variance < 0.1:
             return "very_stable"
         elif variance < 0.3:
@@ -11,17 +11,16 @@ from pathlib import Path
 # Add the app directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.models.database import Base, engine, SessionLocal
-from app.models.database import User, Session, MoodEntry, Interaction, SystemMetrics
+from app.models.database import SessionLocal, db_manager
+from app.models.database import User, TherapySession, MoodEntry, Interaction, SystemMetrics
 
 def create_database():
     """Create the database and tables."""
     print("Creating database tables...")
     
     try:
-        # Create all tables
-        Base.metadata.create_all(bind=engine)
-        print("Database tables created successfully")
+        # Create all tables (and the monthly partitions on Postgres)
+        db_manager.create_tables()
         return True
     except Exception as e:
         print(f"Error creating database: {e}")
@@ -53,7 +52,7 @@ def create_sample_data():
         db.commit()
         
         # Create a sample session
-        sample_session = Session(
+        sample_session = TherapySession(
             user_id=test_user.id,
             session_type="therapy",
             status="completed",
@@ -100,7 +99,7 @@ def verify_database():
     try:
         # Test basic queries
         user_count = db.query(User).count()
-        session_count = db.query(Session).count()
+        session_count = db.query(TherapySession).count()
         mood_count = db.query(MoodEntry).count()
         
         print(f" Database verification successful:")
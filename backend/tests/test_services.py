@@ -160,7 +160,8 @@ class TestAudioProcessor:
             
             assert len(audio) > 0
             assert sample_rate == 16000
-            assert isinstance(temp_path, str)
+            # WAV payloads are decoded in memory, so no temporary file is left to clean up
+            assert temp_path is None
     
     def test_audio_processing_error_handling(self, sample_audio_data):
         """Test audio processing error handling."""
@@ -172,3 +173,67 @@ class TestAudioProcessor:
             from app.services.audio_processor import audio_processor
             with pytest.raises(Exception):
                 audio_processor.process_base64_audio(sample_audio_data)
+
+class TestSecurityManager:
+    """Test cases for the security manager."""
+    
+    def test_verify_token_reuses_cached_payload(self):
+        """Test that a recently verified token is served from the cache."""
+        from app.core.security import security_manager
+        
+        token = security_manager.create_access_token({"sub": "cached_user"})
+        first = security_manager.verify_token(token)
+        
+        with patch('app.core.security.jwt.decode') as mock_decode:
+            second = security_manager.verify_token(token)
+            mock_decode.assert_not_called()
+        
+        assert second == first
+        assert second["sub"] == "cached_user"
+    
+    def test_verify_token_rejects_invalid_token(self):
+        """Test that an invalid token is rejected and not cached."""
+        from app.core.security import security_manager, _token_cache
+        
+        assert security_manager.verify_token("not-a-jwt") is None
+        assert "not-a-jwt" not in _token_cache
+    
+    def test_rate_limit_window(self):
+        """Test that the fixed-window rate limit blocks and then resets."""
+        from app.core import security
+        
+        with patch.object(security, 'RATE_LIMIT_REQUESTS', 3), \
+             patch('app.core.security.time.monotonic', return_value=1000.0) as mock_time:
+            results = [security.security_manager.check_rate_limit("10.0.0.1", "GET:/limited") for _ in range(4)]
+            assert results == [True, True, True, False]
+            
+            mock_time.return_value = 1000.0 + security.RATE_LIMIT_WINDOW
+            assert security.security_manager.check_rate_limit("10.0.0.1", "GET:/limited") is True
+    
+    def test_refresh_token_revokes_old_token(self):
+        """Test that refreshing a token rotates it and rejects the old one."""
+        from app.core.security import SecurityManager
+        
+        manager = SecurityManager()
+        token = manager.create_access_token({"sub": "test_user", "user_id": "test_user"})
+        
+        new_token = manager.refresh_token(token)
+        
+        assert new_token is not None
+        assert manager.verify_token(new_token)["sub"] == "test_user"
+        assert manager.verify_token(token) is None
+        assert manager.refresh_token(token) is None
+    
+    def test_cached_token_revoked_on_another_worker(self):
+        """Test that a cache hit still consults the shared revocation set."""
+        from app.core.security import SecurityManager
+        
+        redis_client = Mock()
+        redis_client.exists.return_value = 0
+        manager = SecurityManager(redis_client)
+        token = manager.create_access_token({"sub": "test_user"})
+        assert manager.verify_token(token)["sub"] == "test_user"
+        
+        # Another worker revokes the token after this one cached it
+        redis_client.exists.return_value = 1
+        assert manager.verify_token(token) is None